@@ -0,0 +1,139 @@
+import json
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+import werd.translate
+from werd.config import ConfigModel
+
+
+class CharEncoding:
+    """Stand-in tokenizer with one token per character, so no download needed."""
+
+    def encode(self, text: str) -> list[str]:
+        return list(text)
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+@pytest.fixture
+def char_tokens(monkeypatch):
+    monkeypatch.setattr(werd.translate, "get_encoding", lambda model: CharEncoding())
+
+
+class StubServer:
+    """
+    A local stand in for an OpenAI compatible chat completions server. Replies
+    with `reply(messages)`, the upper cased source text by default.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.reply = (
+            lambda messages: messages[-2]["content"].split("---\n", 1)[-1].upper()
+        )
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests.append(body)
+                content = stub.reply(body["messages"])
+                if body.get("stream"):
+                    self.stream(body, content)
+                    return
+                reply = json.dumps(
+                    {
+                        "id": "chatcmpl-123",
+                        "object": "chat.completion",
+                        "created": 1677652288,
+                        "model": body["model"],
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": 9,
+                            "completion_tokens": 12,
+                            "total_tokens": 21,
+                        },
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def stream(self, body, content):
+                """Send the reply as server sent events, a few characters each."""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for i in range(0, len(content), 4):
+                    chunk = {
+                        "id": "chatcmpl-123",
+                        "object": "chat.completion.chunk",
+                        "created": 1677652288,
+                        "model": body["model"],
+                        "choices": [
+                            {
+                                "index": 0,
+                                "delta": {"content": content[i : i + 4]},
+                                "finish_reason": None,
+                            }
+                        ],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+def site_reply(messages: list[dict]) -> str:
+    """Translates "blog" for the strings, upper cases the source text otherwise."""
+    if "JSON" in messages[0]["content"]:
+        return '[["blog", "Blog"]]'
+    return messages[-2]["content"].split("---\n", 1)[-1].upper()
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch, stub_server, char_tokens) -> ConfigModel:
+    """
+    The test content copied to tmp_path, the working directory, and the
+    config to translate it into en and de with the stub server and no cache.
+    """
+    shutil.copytree(Path(__file__).parent / "content", tmp_path / "content")
+    monkeypatch.chdir(tmp_path)
+    stub_server.reply = site_reply
+    return ConfigModel(
+        site_name={"en": "My Mulitlingual Website"},
+        language={"default": "en", "source": "en", "output": ["en", "de"]},
+        backend={"provider": "openai-compatible", "base_url": stub_server.base_url},
+        cache={"enabled": False},
+    )
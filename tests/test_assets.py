@@ -0,0 +1,87 @@
+import gzip
+import os
+from pathlib import Path
+
+import pytest
+
+from werd.assets import (
+    COMPRESSORS,
+    CompressedFiles,
+    collect_assets,
+    compress_files,
+    sync_assets,
+)
+
+
+def test_sync_assets(tmp_path: Path):
+    theme, content, output = tmp_path / "theme", tmp_path / "content", tmp_path / "out"
+    (theme / "css").mkdir(parents=True)
+    (theme / "css" / "site.css").write_text("body {}")
+    (theme / "logo.png").write_bytes(b"theme logo")
+    content.mkdir()
+    (content / "logo.png").write_bytes(b"content logo")
+
+    assert sync_assets(collect_assets([theme, content]), output) == (2, 0, 0)
+    assert (output / "logo.png").read_bytes() == b"content logo", "Content wins"
+    assert (output / "logo.png").stat().st_mode == (content / "logo.png").stat().st_mode
+    assert sync_assets(collect_assets([theme, content]), output) == (0, 2, 0)
+
+    os.utime(theme / "css" / "site.css", ns=(0, 0))  # Touched, same content
+    assert sync_assets(collect_assets([theme, content]), output) == (0, 2, 0)
+
+    (theme / "css" / "site.css").unlink()
+    (content / "logo.png").write_bytes(b"new content logo")
+    assert sync_assets(collect_assets([theme, content]), output) == (1, 0, 1)
+    assert (output / "logo.png").read_bytes() == b"new content logo"
+    assert not (output / "css").exists()
+
+
+def test_sync_assets_link(tmp_path: Path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "video.mp4").write_bytes(b"big")
+
+    sync_assets(collect_assets([tmp_path / "src"]), tmp_path / "out", link=True)
+
+    assert os.path.samefile(
+        tmp_path / "src" / "video.mp4", tmp_path / "out" / "video.mp4"
+    )
+
+
+def test_compress_files(tmp_path: Path):
+    site = tmp_path / "site"
+    site.mkdir()
+    (site / "index.html").write_text("<p>Hello</p>" * 100)
+    (site / "about.html").write_text("<p>About</p>")
+    (site / "logo.png").write_bytes(b"not compressible")
+    (site / "data.json").write_text("{}")
+    (site / "data.json.gz").write_bytes(b"shipped as is")
+    (site / "logo.png.gz").write_bytes(b"shipped as is")
+    state = CompressedFiles(tmp_path / "compressed.db")
+
+    assert compress_files(site, [], state) == (0, 0)
+    assert not (site / "index.html.gz").exists()
+    assert (site / "data.json.gz").read_bytes() == b"shipped as is", "Not ours"
+
+    assert compress_files(site, ["gzip"], state) == (3, 0)  # Not the png
+    html = (site / "index.html").read_text()
+    assert gzip.decompress((site / "index.html.gz").read_bytes()).decode() == html
+
+    os.utime(site / "index.html", ns=(0, 0))  # Touched, same content
+    assert compress_files(site, ["gzip"], state) == (0, 0)
+    state.close()
+
+    state = CompressedFiles(tmp_path / "compressed.db")
+    (site / "index.html").write_text("<p>Bye</p>")
+    (site / "about.html").unlink()
+    assert compress_files(site, ["gzip"], state) == (1, 1)
+    assert gzip.decompress((site / "index.html.gz").read_bytes()) == b"<p>Bye</p>"
+    assert not (site / "about.html.gz").exists()
+
+    assert compress_files(site, [], state) == (0, 2)
+    assert not (site / "index.html.gz").exists()
+
+
+def test_compress_files_missing_package(tmp_path: Path, monkeypatch):
+    monkeypatch.setitem(COMPRESSORS, "brotli", (".br", lambda data: data, None))
+    with pytest.raises(ValueError, match="werd\\[compress\\]"):
+        compress_files(tmp_path, ["brotli"], CompressedFiles(tmp_path / "c.db"))
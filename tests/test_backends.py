@@ -0,0 +1,150 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+import werd.backends
+from werd.backends import (
+    CassetteMissError,
+    OpenAIBackend,
+    RateLimitedError,
+    StreamingBackend,
+    get_backend,
+)
+from werd.config import BackendConfig
+from werd.translate import translate_content, translate_string
+
+
+def test_get_backend():
+    assert isinstance(
+        get_backend(BackendConfig(provider="openai-compatible", base_url="http://x")),
+        OpenAIBackend,
+    )
+    with pytest.raises(ValueError):
+        get_backend(BackendConfig(provider="carrier-pigeon"))
+
+
+def test_openai_compatible_backend(stub_server, char_tokens):
+    backend = get_backend(
+        BackendConfig(
+            provider="openai-compatible",
+            base_url=stub_server.base_url,
+            model="llama-3-8b-instruct",
+        )
+    )
+
+    assert translate_string("hello", "en", "de", backend=backend) == "HELLO\n"
+    assert stub_server.requests[0]["model"] == "llama-3-8b-instruct"
+
+
+def test_translate_content_with_backend(tmp_path: Path, site, stub_server):
+    site.backend.model = "llama-3-8b-instruct"
+    site.backend.concurrency = 2
+
+    translate_content(site)
+
+    assert (tmp_path / "_translations" / "de" / "about_us.md").read_text() == (
+        (tmp_path / "content" / "about_us.md").read_text().upper()
+    )
+    assert (tmp_path / "_translations" / "en" / "pages" / "a-team.md").exists()
+
+
+def test_record_and_replay(tmp_path: Path, stub_server, char_tokens):
+    cassette = tmp_path / "cassette.jsonl"
+    recorder = get_backend(
+        BackendConfig(
+            provider="openai-compatible",
+            base_url=stub_server.base_url,
+            record=cassette,
+        )
+    )
+    assert translate_string("hello", "en", "de", backend=recorder) == "HELLO\n"
+    stub_server.close()
+
+    replay = get_backend(BackendConfig(provider="replay", cassette=cassette))
+    assert translate_string("hello", "en", "de", backend=replay) == "HELLO\n"
+    with pytest.raises(CassetteMissError):
+        translate_string("goodbye", "en", "de", backend=replay)
+
+    flaky = get_backend(
+        BackendConfig(provider="replay", cassette=cassette, replay_error_rate=1.0)
+    )
+    with pytest.raises(RateLimitedError):
+        translate_string("hello", "en", "de", backend=flaky)
+
+
+def test_translate_content_replay(tmp_path: Path, site, stub_server):
+    """A recorded run can be replayed offline with the same results."""
+    cassette = tmp_path / "cassette.jsonl"
+    site.backend.record = cassette
+    translate_content(site)
+    recorded = (tmp_path / "_translations" / "de" / "about_us.md").read_text()
+    stub_server.close()
+    shutil.rmtree(tmp_path / "_translations")
+
+    site.backend = BackendConfig(provider="replay", cassette=cassette)
+    translate_content(site, translate_all=True)
+
+    assert (tmp_path / "_translations" / "de" / "about_us.md").read_text() == recorded
+
+
+def test_translate_content_record_with_cache(tmp_path: Path, site, stub_server):
+    """Recording doesn't miss the requests in the cache."""
+    cassette = tmp_path / "cassette.jsonl"
+    site.cache.enabled = True
+    translate_content(site)  # Fills the cache
+    shutil.rmtree(tmp_path / "_translations")
+
+    site.backend.record = cassette
+    translate_content(site, translate_all=True)
+    recorded = (tmp_path / "_translations" / "de" / "about_us.md").read_text()
+    stub_server.close()
+    shutil.rmtree(tmp_path / "_translations")
+
+    site.backend = BackendConfig(provider="replay", cassette=cassette)
+    translate_content(site, translate_all=True)
+
+    assert (tmp_path / "_translations" / "de" / "about_us.md").read_text() == recorded
+
+
+def test_streaming_backend(stub_server, char_tokens, monkeypatch):
+    reported = []
+    monkeypatch.setattr(werd.backends, "report_tokens", lambda: reported.append(1))
+    config = BackendConfig(provider="openai-compatible", base_url=stub_server.base_url)
+    backend = StreamingBackend(config, get_backend(config))
+
+    assert translate_string("hello world", "en", "de", backend=backend) == (
+        "HELLO WORLD\n"
+    )
+    assert stub_server.requests[0]["stream"]
+    assert len(reported) == 3, "Should report each chunk as it arrives"
+
+
+def test_shared_client(stub_server):
+    config = BackendConfig(provider="openai-compatible", base_url=stub_server.base_url)
+    assert get_backend(config).client is get_backend(config).client
+
+
+def test_translate_content_fan_out(tmp_path: Path, site, stub_server):
+    """Should translate each file into every language in one request."""
+
+    def reply(messages):
+        source = messages[-2]["content"].split("---\n", 1)[-1]
+        if "JSON object" in messages[0]["content"]:
+            return json.dumps({"de": source.upper(), "jp": source.lower()})
+        return '[["blog", "Blog"]]'
+
+    stub_server.reply = reply
+    site.language.output = ["en", "de", "jp"]
+    site.translate.fan_out = True
+    site.translate.fan_out_max_tokens = 100000
+
+    translate_content(site)
+
+    about_us = (tmp_path / "content" / "about_us.md").read_text()
+    translations = tmp_path / "_translations"
+    assert (translations / "de" / "about_us.md").read_text() == about_us.upper()
+    assert (translations / "jp" / "about_us.md").read_text() == about_us.lower()
+    fan_outs = [r for r in stub_server.requests if "JSON object" in str(r)]
+    assert len(fan_outs) == 4, "One request per file for both languages"
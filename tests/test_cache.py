@@ -0,0 +1,73 @@
+import os
+import shutil
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from werd.backends import CachingBackend, get_backend
+from werd.cache import TranslationCache
+from werd.cli import cli
+from werd.config import BackendConfig
+from werd.translate import translate_string
+
+
+def test_cache_get_put_prune(tmp_path: Path):
+    cache = TranslationCache(tmp_path / "cache", max_size=10)
+
+    assert cache.get("abc123") is None
+    cache.put("abc123", "Hallo")
+    assert cache.get("abc123") == "Hallo"
+    assert cache.stats() == (1, 5)
+
+    cache.put("def456", "Welt!!")
+    os.utime(cache.file("def456"), (0, 0))  # Least recently used
+    assert cache.prune() == (1, 6)
+    assert cache.get("def456") is None
+    assert cache.get("abc123") == "Hallo"
+
+    assert cache.prune(0) == (1, 5)
+    assert cache.stats() == (0, 0)
+
+
+def test_cache_put_without_sync(tmp_path: Path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", synced.append)
+
+    TranslationCache(tmp_path / "cache", max_size=10, sync=False).put("abc", "Hi")
+    assert not synced
+    TranslationCache(tmp_path / "cache", max_size=10).put("def", "Hi")
+    assert synced
+
+
+def test_caching_backend(tmp_path: Path, stub_server, char_tokens):
+    config = BackendConfig(provider="openai-compatible", base_url=stub_server.base_url)
+    backend = CachingBackend(
+        config,
+        get_backend(config),
+        TranslationCache(tmp_path / "cache", max_size=1024),
+    )
+
+    assert translate_string("hello", "en", "de", backend=backend) == "HELLO\n"
+    assert translate_string("hello", "en", "de", backend=backend) == "HELLO\n"
+    assert len(stub_server.requests) == 1, "Should answer from the cache"
+
+    translate_string("hello", "en", "jp", backend=backend)
+    assert len(stub_server.requests) == 2, "Another language is another request"
+
+
+def test_cache_commands(tmp_path: Path, monkeypatch):
+    shutil.copyfile(
+        Path(__file__).parent.parent / "werd/templates/config.yaml",
+        tmp_path / "config.yaml",
+    )
+    monkeypatch.chdir(tmp_path)
+    TranslationCache(Path(".werd/cache"), 0).put("abc123", "Hallo")
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ["cache", "stats"])
+    assert result.exit_code == 0
+    assert result.output.startswith("1 cached translations")
+
+    result = runner.invoke(cli, ["cache", "prune", "--max-size", "0"])
+    assert result.exit_code == 0
+    assert result.output.startswith("Removed 1 cached translations")
@@ -1,3 +1,5 @@
+import os
+
 CONTENT = "content"
 
 from werd.content_tracker import ContentTracker
@@ -19,3 +21,43 @@ def test_create_file(tmp_path):
     assert tracker.has_changed(p)
     tracker.update(p)
     assert not tracker.has_changed(p)
+
+
+def test_stat_short_circuit(tmp_path, monkeypatch):
+    p = tmp_path / "hello.txt"
+    p.write_text(CONTENT)
+    tracker = ContentTracker(tmp_path / "content.db")
+    tracker.update(p)
+    tracker.save()
+
+    tracker = ContentTracker(tmp_path / "content.db")
+    hashed = []
+    get_checksum = tracker.get_checksum
+    monkeypatch.setattr(
+        tracker, "get_checksum", lambda f: hashed.append(f) or get_checksum(f)
+    )
+    assert not tracker.has_changed(p)
+    assert not hashed, "Unchanged stat should not read the file"
+
+    os.utime(p, ns=(0, 0))
+    assert not tracker.has_changed(p), "Touched but the content is the same"
+    assert hashed
+
+
+def test_readonly(tmp_path):
+    p = tmp_path / "hello.txt"
+    p.write_text(CONTENT)
+    ContentTracker(tmp_path / "new.db", readonly=True).save()
+    assert not (tmp_path / "new.db").exists()
+
+    tracker = ContentTracker(tmp_path / "content.db")
+    tracker.update(p)
+    tracker.save()
+
+    tracker = ContentTracker(tmp_path / "content.db", readonly=True)
+    assert not tracker.has_changed(p)
+    p.write_text(CONTENT + " something")
+    tracker.update(p)
+    assert not tracker.has_changed(p)
+    tracker.close()
+    assert ContentTracker(tmp_path / "content.db").has_changed(p), "Not saved"
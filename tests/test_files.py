@@ -0,0 +1,17 @@
+import os
+import stat
+from pathlib import Path
+
+from werd.files import UMASK, write_text_atomic
+
+
+def test_write_text_atomic_mode(tmp_path: Path):
+    file = tmp_path / "page.md"
+    write_text_atomic(file, "Hello")
+    assert file.read_text() == "Hello"
+    assert stat.S_IMODE(file.stat().st_mode) == 0o666 & ~UMASK
+
+    os.chmod(file, 0o640)
+    write_text_atomic(file, "Bye")
+    assert file.read_text() == "Bye"
+    assert stat.S_IMODE(file.stat().st_mode) == 0o640, "Keeps the file's mode"
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import pytest
+
+from werd.content_tracker import ContentTracker
+from werd.journal import Journal
+from werd.translate import (
+    JOURNAL,
+    TRACKER,
+    translate_content,
+    translation_version,
+)
+
+
+def test_journal_pending(tmp_path: Path):
+    journal = Journal(tmp_path / "journal.jsonl")
+    assert journal.pending() == []
+
+    journal.start([("a.md", "de"), ("a.md", "jp"), ("b.md", "de")])
+    journal.done("a.md", "jp", "gpt/1", "0123")
+    with journal.path.open("a") as f:
+        f.write('{"done": ["b.md", "d')  # Crashed half way through a line
+
+    assert journal.pending() == [("a.md", "de"), ("b.md", "de")]
+    assert journal.finished() == [("a.md", "jp", "gpt/1", "0123")]
+    journal.finish()
+    assert not journal.exists()
+
+
+def test_translate_resume(tmp_path: Path, site, stub_server, monkeypatch):
+    """An interrupted run can be resumed with just the files it had left."""
+    fail = True
+
+    def reply(messages):
+        if "JSON" in messages[0]["content"]:
+            return '[["blog", "Blog"]]'
+        if fail and "About Us" not in messages[-2]["content"]:
+            raise RuntimeError("Server fell over")
+        return messages[-2]["content"].split("---\n", 1)[-1].upper()
+
+    stub_server.reply = reply
+    site.backend.concurrency = 1
+    site.backend.max_retries = 0
+    with monkeypatch.context() as killed, pytest.raises(Exception):
+        killed.setattr(ContentTracker, "save", lambda self: None)  # Not saved
+        translate_content(site)
+
+    pending = Journal(JOURNAL).pending()
+    assert ("content/pages/a-team.md", "de") in pending
+    assert ("content/pages/a-team.md", "en") not in pending
+    assert ("content/about_us.md", "de") not in pending
+
+    fail = False
+    stub_server.requests.clear()
+    translate_content(site, resume=True)
+
+    assert not JOURNAL.exists()
+    assert (tmp_path / "_translations" / "de" / "pages" / "a-team.md").exists()
+    version = translation_version(site.backend.model)
+    tracker = ContentTracker(TRACKER)
+    for file in ["content/pages/a-team.md", "content/about_us.md"]:
+        for lang in ["en", "de"]:
+            assert not tracker.has_changed(file, lang, version)
+    assert not any(
+        "About Us" in message["content"]
+        for request in stub_server.requests
+        for message in request["messages"]
+    ), "Files finished before the crash are not translated again"
@@ -0,0 +1,26 @@
+from pathlib import Path
+
+from werd.cache import TranslationCache
+from werd.markdown_converter import MarkdownConverter
+
+
+def test_converter_resets_between_documents():
+    converter = MarkdownConverter()
+
+    assert converter.convert("[link][x]\n\n[x]: http://x.com") == (
+        '<p><a href="http://x.com">link</a></p>'
+    )
+    assert converter.convert("[link][x]") == "<p>[link][x]</p>"
+
+
+def test_converter_cache(tmp_path: Path, monkeypatch):
+    cache = TranslationCache(tmp_path, 1024 * 1024)
+    MarkdownConverter(cache=cache).convert("# Hello")
+
+    converter = MarkdownConverter(cache=cache)
+    monkeypatch.setattr(converter.md, "convert", None)  # Not parsed again
+    assert converter.convert("# Hello") == "<h1>Hello</h1>"
+
+    tables = MarkdownConverter(["tables"], cache=cache)
+    assert "<table>" in tables.convert("| a |\n| - |\n| b |")
+    assert cache.stats()[0] == 2
@@ -0,0 +1,29 @@
+from werd.minify import minify_html
+
+
+def test_minify_html():
+    html = """<html>
+    <!-- A comment -->
+    <body>
+        <p>Some   <b>bold</b> text</p>
+        <pre>  keep
+    this  </pre>
+        <script>if (a  <  b) {}</script>
+        <!--[if IE]><p>Old</p><![endif]-->
+    </body>
+</html>
+"""
+    assert minify_html(html) == (
+        "<html>\n<body>\n<p>Some <b>bold</b> text</p>\n"
+        "<pre>  keep\n    this  </pre>\n<script>if (a  <  b) {}</script>\n"
+        "<!--[if IE]><p>Old</p><![endif]-->\n</body>\n</html>"
+    )
+
+
+def test_minify_html_attributes():
+    html = """<img   src="a.png"
+    alt="Two  spaces"  title='a > b,  c'>  <a href="/">Home  page</a>"""
+    assert minify_html(html) == (
+        """<img src="a.png"\nalt="Two  spaces" title='a > b,  c'> """
+        """<a href="/">Home page</a>"""
+    )
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+import werd.backends
+import werd.rate_limit
+from werd.backends import Backend, RateLimitedBackend, RateLimitedError
+from werd.config import BackendConfig
+from werd.rate_limit import RateLimiter, backoff
+
+
+class FlakyBackend(Backend):
+    """Rate limited for the first `failures` requests."""
+
+    def __init__(self, failures: int):
+        super().__init__(BackendConfig(max_retries=3))
+        self.failures = failures
+        self.requests = 0
+
+    def complete(self, messages, max_tokens):
+        self.requests += 1
+        if self.requests <= self.failures:
+            raise RateLimitedError("Slow down!")
+        return "Hallo"
+
+
+def test_limiter_aimd():
+    limiter = RateLimiter(max_concurrency=8, min_concurrency=1)
+
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 2
+
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release()
+    assert 2 < limiter.limit <= 8, "Should grow back slowly"
+
+
+def test_limiter_requests_per_minute(monkeypatch):
+    monkeypatch.setattr(werd.rate_limit, "WINDOW", 0.2)
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=100)
+
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(10)
+        limiter.release()
+    assert time.monotonic() - started >= 0.2, "Third request waits for the window"
+
+    assert limiter.wait_time(95, time.monotonic()) > 0, "Over the token quota"
+
+
+def test_rate_limited_backend_retries(monkeypatch):
+    monkeypatch.setattr(werd.backends, "backoff", lambda attempt, retry_after: 0)
+    limiter = RateLimiter(max_concurrency=4)
+
+    flaky = FlakyBackend(failures=2)
+    backend = RateLimitedBackend(flaky.config, flaky, limiter, lambda m: 1)
+    assert backend.complete([], 10) == "Hallo"
+    assert flaky.requests == 3
+    assert limiter.limit == 1 + 1 / 1, "Halved twice then grew by one request"
+    assert limiter.active == 0
+
+    flaky = FlakyBackend(failures=10)
+    backend = RateLimitedBackend(flaky.config, flaky, limiter, lambda m: 1)
+    with pytest.raises(RateLimitedError):
+        backend.complete([], 10)
+    assert flaky.requests == 4, "Should give up after max_retries"
+
+
+def test_backoff():
+    assert 0 <= backoff(0) <= 1
+    assert 0 <= backoff(10) <= 60
+    assert backoff(0, retry_after=5) == 5
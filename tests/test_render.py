@@ -2,11 +2,19 @@ import os
 import shutil
 from pathlib import Path
 
+import pytest
 from dotenv import load_dotenv
+from jinja2 import UndefinedError
 
 from werd.config import ConfigModel
-from werd.data import BlogPost, Page
-from werd.render import find_template_file, render_content
+from werd.data import BlogPost, FileSystemNode, Page
+from werd.render import (
+    HtmlPageRenderer,
+    PageTree,
+    find_template_file,
+    render_content,
+)
+from werd.strings_map import StringMap
 
 load_dotenv("tests/.env")
 
@@ -113,3 +121,276 @@ def test_render_find_template_file(tmp_path: Path):
     assert template_path == Path(
         "themes/default/blog/kirk_is_born.j2"
     ), "Should use the more specific 'kirk_is_born' blog template"
+
+
+def make_site(path: Path, monkeypatch) -> ConfigModel:
+    """A small site with a working theme, already translated, as the working dir."""
+    monkeypatch.chdir(path)
+    theme = path / "theme"
+    (theme / "blog").mkdir(parents=True)
+    (theme / "base.j2").write_text(
+        "<html><head><title>{{ page.title }} - {{ site_name }}</title></head>"
+        "<body><nav>{% for p in pages %}<a href='/{{ p.href }}'>{{ p.title }}</a>"
+        "{% endfor %}</nav>{% block content %}{% endblock %}"
+        "<footer>{{ layout.footer }}</footer></body></html>"
+    )
+    (theme / "index.j2").write_text(
+        '{% extends "base.j2" %}{% block content %}'
+        "<article>{{ page.content }}</article>{% endblock %}"
+    )
+    (theme / "blog" / "index.j2").write_text(
+        '{% extends "base.j2" %}{% block content %}'
+        "<time>{{ page.date }}</time>{{ page.content }}{% endblock %}"
+    )
+    (theme / "landing.j2").write_text("<html>{{ supported_languages }}</html>")
+
+    for lang in ["en", "de"]:
+        root = path / "_translations" / lang
+        for file in [
+            "about_us.md",
+            "_layout/footer.md",
+            "pages/a-team.md",
+            "pages/b-team.md",
+            "blog/2023-12-08/rocked.md",
+        ]:
+            (root / file).parent.mkdir(parents=True, exist_ok=True)
+            (root / file).write_text(f"# {file} [{lang}]\n\nSome *{lang}* text.\n")
+
+    return ConfigModel(
+        site_name={"en": "Data Ninja", "de": "Daten Ninja"},
+        language={"default": "en", "source": "en", "output": ["en", "de"]},
+    )
+
+
+def test_render_jobs(tmp_path: Path, monkeypatch):
+    """Rendering in parallel gives the same output as rendering serially."""
+    config = make_site(tmp_path, monkeypatch)
+
+    render_content(config)
+    serial = {
+        file.relative_to(tmp_path / "output"): file.read_bytes()
+        for file in sorted((tmp_path / "output").glob("**/*"))
+        if file.is_file()
+    }
+    shutil.rmtree(tmp_path / "output")
+    render_content(config, jobs=3)
+    parallel = {
+        file.relative_to(tmp_path / "output"): file.read_bytes()
+        for file in sorted((tmp_path / "output").glob("**/*"))
+        if file.is_file()
+    }
+
+    assert Path("de/pages/a-team.html") in serial
+    assert Path("en/blog/2023-12-08/rocked/index.html") in serial
+    assert parallel == serial
+    assert not Path(".werd/compressed.db").exists(), "Nothing to compress"
+
+
+def test_render_incremental(tmp_path: Path, monkeypatch, capsys):
+    """Only the pages whose inputs changed are rendered again."""
+    config = make_site(tmp_path, monkeypatch)
+    render_content(config)
+    assert "Rendered 16 of 16 pages" in capsys.readouterr().out
+
+    render_content(config)
+    assert "Nothing has changed" in capsys.readouterr().out
+    assert not (tmp_path / "_translations" / "strings.db").exists()
+
+    config.translate.chunk_tokens = 500  # Not a render setting
+    render_content(config)
+    assert "Nothing has changed" in capsys.readouterr().out
+
+    (tmp_path / "output" / "en" / "about_us.html").unlink()
+    (tmp_path / "output" / "de" / "about_us.html").write_text("Oops")
+    render_content(config)
+    assert "Rendered 2 of 16 pages" in capsys.readouterr().out
+    assert (
+        "about_us.md [de]" in (tmp_path / "output" / "de" / "about_us.html").read_text()
+    )
+
+    (tmp_path / "_translations" / "de" / "pages" / "a-team.md").write_text("# Neu")
+    render_content(config)
+    # And the index of pages, which could show it
+    assert "Rendered 2 of 16 pages" in capsys.readouterr().out
+    assert "Neu" in (tmp_path / "output" / "de" / "pages" / "a-team.html").read_text()
+
+    # Every page extends the base template
+    (tmp_path / "theme" / "base.j2").write_text(
+        "<main>{% block content %}{% endblock %}</main>"
+    )
+    render_content(config)
+    assert "Rendered 16 of 16 pages" in capsys.readouterr().out
+
+    render_content(config, force=True)
+    assert "Rendered 16 of 16 pages" in capsys.readouterr().out
+
+
+def test_render_incremental_subpages(tmp_path: Path, monkeypatch, capsys):
+    """Index pages are rendered again when a subpage they show changes."""
+    config = make_site(tmp_path, monkeypatch)
+    (tmp_path / "theme" / "index.j2").write_text(
+        "{{ page.content }}{% for s in subpages %}{{ s.content }}{% endfor %}"
+    )
+    render_content(config)
+    capsys.readouterr()
+
+    (tmp_path / "_translations" / "en" / "pages" / "a-team.md").write_text("# Neu")
+    render_content(config)
+    assert "Rendered 2 of 16 pages" in capsys.readouterr().out
+    assert "Neu" in (tmp_path / "output" / "en" / "pages" / "index.html").read_text()
+
+
+def test_render_output_modes(tmp_path: Path, monkeypatch):
+    config = make_site(tmp_path, monkeypatch)
+    page = tmp_path / "output" / "en" / "about_us.html"
+    sizes = {}
+    landing_pages = {}
+    for output in ["pretty", "minify", "raw"]:
+        config.render.output = output
+        render_content(config)
+        sizes[output] = len(page.read_text())
+        landing_pages[output] = (tmp_path / "output" / "index.html").read_text()
+
+    assert "<h1>about_us.md [en]</h1>" in page.read_text()
+    assert sizes["minify"] < sizes["pretty"]
+    assert landing_pages["raw"] == "<html>['en', 'de']</html>"
+    assert landing_pages["pretty"] != landing_pages["raw"]
+
+
+def test_render_raw_failure(tmp_path: Path, monkeypatch):
+    """A page that fails to render part-way doesn't replace the last one."""
+    config = make_site(tmp_path, monkeypatch)
+    config.render.output = "raw"
+    render_content(config)
+    page = tmp_path / "output" / "en" / "about_us.html"
+    rendered = page.read_text()
+
+    (tmp_path / "theme" / "index.j2").write_text(
+        "<article>{{ page.content }}</article>{{ page.missing.missing }}"
+    )
+    with pytest.raises(UndefinedError):
+        render_content(config)
+
+    assert page.read_text() == rendered
+    assert not list((tmp_path / "output").glob("**/*.tmp"))
+
+
+def test_page_tree_is_lazy(tmp_path: Path, monkeypatch):
+    """Page content is only converted when rendered, then released."""
+    config = make_site(tmp_path, monkeypatch)
+    converted = []
+
+    class Converter:
+        def convert(self, text):
+            converted.append(text)
+            return text
+
+    root = FileSystemNode(config.translations_dir / "en")
+    tree = root.accept(PageTree("en", config, StringMap(config), Converter()))
+    assert not converted
+
+    about_us = next(p for p in tree.subpages if p.filepath.stem == "about_us")
+    assert about_us.content.startswith("# about_us.md")
+    assert about_us.content and len(converted) == 1, "Kept until released"
+    about_us.release()
+    assert about_us._content is None
+    assert not hasattr(about_us, "__dict__"), "Slotted"
+    assert about_us.fields() == {
+        "href": "en/about_us.html",
+        "lang": "en",
+        "title": "about us",
+        "filepath": config.translations_dir / "en" / "about_us.md",
+        "source": config.translations_dir / "en" / "about_us.md",
+    }
+
+
+def test_render_releases_every_page(tmp_path: Path, monkeypatch):
+    """Skipped pages are released too, even if an index page converted them."""
+    config = make_site(tmp_path, monkeypatch)
+    (tmp_path / "theme" / "index.j2").write_text(
+        "{% for p in subpages %}{{ p.content }}{% endfor %}"
+    )
+    root = FileSystemNode(config.translations_dir / "en")
+    tree = root.accept(PageTree("en", config, StringMap(config)))
+
+    def pages(page):
+        yield page
+        for subpage in getattr(page, "subpages", []):
+            yield from pages(subpage)
+
+    renderer = HtmlPageRenderer("en", config, tree, {}, batches=2)
+    tree.accept(renderer)
+    previous = renderer.outputs
+    for batch in range(2):  # Unchanged pages, then pages of the other batch
+        renderer = HtmlPageRenderer(
+            "en", config, tree, {}, batch=batch, batches=2, previous=previous
+        )
+        tree.accept(renderer)
+        assert all(
+            page._content is None for page in pages(tree) if hasattr(page, "_content")
+        )
+
+
+def test_render_fingerprinted_assets(tmp_path: Path, monkeypatch):
+    config = make_site(tmp_path, monkeypatch)
+    (tmp_path / "theme" / "assets").mkdir()
+    (tmp_path / "theme" / "assets" / "site.css").write_text("body {}")
+    (tmp_path / "theme" / "index.j2").write_text(
+        "<link href='{{ asset_url(\"site.css\") }}'>{{ page.content }}"
+    )
+    config.render.output = "raw"
+    config.render.fingerprint_assets = True
+    config.render.compress = ["gzip"]
+
+    render_content(config)
+
+    output = tmp_path / "output"
+    (css,) = (output / "assets").glob("site.*.css")
+    assert f"href='/assets/{css.name}'" in (output / "en" / "about_us.html").read_text()
+    assert (output / "en" / "about_us.html.gz").exists()
+    assert css.with_name(css.name + ".gz").exists()
+    assert (output / "assets" / "site.css").read_text() == "body {}", "For url()s"
+
+    (tmp_path / "theme" / "assets" / "site.css").write_text("body { margin: 0 }")
+    render_content(config)
+
+    (new_css,) = (output / "assets").glob("site.*.css")
+    assert new_css != css and not css.with_name(css.name + ".gz").exists()
+    assert new_css.name in (output / "en" / "about_us.html").read_text()
+    assert (output / "assets" / "site.css").read_text() == "body { margin: 0 }"
+
+
+def test_render_converts_each_page_once(tmp_path: Path, monkeypatch):
+    config = make_site(tmp_path, monkeypatch)
+    (tmp_path / "_translations" / "en" / "pages" / "home.md").write_text("# Home")
+    (tmp_path / "theme" / "index.j2").write_text(
+        "{{ page.content }}{% for p in subpages %}{{ p.content }}{% endfor %}"
+    )
+    converted = []
+
+    class Converter:
+        def convert(self, text):
+            converted.append(text)
+            return text
+
+    root = FileSystemNode(config.translations_dir / "en")
+    tree = root.accept(PageTree("en", config, StringMap(config), Converter()))
+    tree.accept(HtmlPageRenderer("en", config, tree, {}))
+
+    assert "# Home" in converted
+    assert len(converted) == len(set(converted)), "Index pages share it"
+    pages = (tmp_path / "output" / "en" / "pages" / "index.html").read_text()
+    assert "Home" in pages and "a-team" in pages
+
+
+def test_render_home_page_next_to_layout(tmp_path: Path, monkeypatch):
+    """A home page in a folder with special (skipped) subfolders."""
+    config = make_site(tmp_path, monkeypatch)
+    (tmp_path / "_translations" / "en" / "home.md").write_text("# Welcome")
+    (tmp_path / "theme" / "index.j2").write_text(
+        "{{ page.content }}{% for s in subpages %}{{ s.href }} {% endfor %}"
+    )
+    render_content(config)
+
+    index = (tmp_path / "output" / "en" / "index.html").read_text()
+    assert "Welcome" in index and "about_us.html" in index
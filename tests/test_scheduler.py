@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from werd.scheduler import (
+    Job,
+    Progress,
+    estimate_duration,
+    format_seconds,
+    report_tokens,
+    run_jobs,
+)
+
+
+def test_run_jobs_longest_first():
+    started = []
+    lock = threading.Lock()
+
+    def work(key):
+        with lock:
+            started.append(key)
+        return key * 2
+
+    done = []
+    jobs = [
+        Job(key=n, fn=lambda n=n: work(n), cost=n, on_done=done.append)
+        for n in [1, 5, 3]
+    ]
+    results = run_jobs(jobs, concurrency=1, progress=False)
+
+    assert results == {1: 2, 5: 10, 3: 6}
+    assert started == [5, 3, 1], "Should start the most costly job first"
+    assert sorted(done) == [2, 6, 10], "Should call on_done with each result"
+
+
+def test_run_jobs_raises():
+    def fail():
+        raise ValueError("nope")
+
+    with pytest.raises(ValueError):
+        run_jobs([Job(key="a", fn=fail)], concurrency=2, progress=False)
+
+
+def test_format_seconds():
+    assert format_seconds(45) == "45s"
+    assert format_seconds(192) == "3m12s"
+    assert format_seconds(3720) == "1h02m"
+
+
+def test_estimate_duration():
+    assert estimate_duration([], 4) == 0
+    assert estimate_duration([3, 3, 2, 2, 2], 2) == 7
+    assert estimate_duration([5, 1, 1], 8) == 5
+
+
+def test_report_tokens(monkeypatch):
+    reported = []
+    monkeypatch.setattr(
+        Progress, "tokens", lambda self, job, tokens: reported.append((job.key, tokens))
+    )
+
+    report_tokens(5)  # Outside a job, nothing to report to
+    run_jobs([Job(key="a", fn=lambda: report_tokens(3))], concurrency=2)
+
+    assert reported == [("a", 3)]
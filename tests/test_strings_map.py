@@ -0,0 +1,54 @@
+import json
+from pathlib import Path
+
+from werd.config import ConfigModel
+from werd.strings_map import StringMap
+
+
+def site_config(path: Path) -> ConfigModel:
+    return ConfigModel(
+        site_name={"en": "My Mulitlingual Website"},
+        language={"default": "en", "source": "en", "output": ["en", "de"]},
+        translations_dir=path / "_translations",
+    )
+
+
+def test_strings_map(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    strings_map = StringMap(site_config(tmp_path))
+    strings_map.add("blog", "de", "Blog")
+    assert strings_map.missing("de", ["blog", "about us", "blog"]) == ["about us"]
+    strings_map.save()
+
+    strings_map = StringMap(site_config(tmp_path))
+    assert strings_map.lookup("de", "blog") == "Blog"
+    assert strings_map.lookup("jp", "blog") == "blog"
+    assert strings_map.get_title("de", Path("content/blog.md")) == "Blog"
+
+    other_site = StringMap(site_config(tmp_path / "other"))
+    assert not other_site.is_translated("blog", "de"), "One store per site"
+
+
+def test_strings_map_imports_json(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "_translations").mkdir()
+    (tmp_path / "_translations" / "strings.json").write_text(
+        json.dumps({"blog": {"de": "Blog", "jp": "ブログ"}})
+    )
+
+    strings_map = StringMap(site_config(tmp_path))
+
+    assert strings_map.lookup("jp", "blog") == "ブログ"
+    assert (tmp_path / "_translations" / "strings.db").exists()
+
+
+def test_strings_map_readonly(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = site_config(tmp_path)
+    assert StringMap(config, readonly=True).lookup("de", "blog") == "blog"
+    assert not (tmp_path / "_translations" / "strings.db").exists()
+
+    strings_map = StringMap(config)
+    strings_map.add("blog", "de", "Blog")
+    strings_map.save()
+    assert StringMap(config, readonly=True).lookup("de", "blog") == "Blog"
@@ -0,0 +1,46 @@
+import shutil
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from werd.cli import cli
+from werd.theme import BYTECODE_CACHE, ThemeIndex
+
+
+def test_theme_index(tmp_path: Path):
+    (tmp_path / "blog").mkdir()
+    (tmp_path / "index.j2").write_text("{{ page.content }}")
+    (tmp_path / "blog" / "index.j2").write_text("{{ page.content }}")
+    (tmp_path / "blog" / "kirk_is_born.j2").write_text("{{ page.content }}")
+    index = ThemeIndex(tmp_path)
+
+    assert index.find(Path("pages/about.md")) == Path("index.j2")
+    assert index.find(Path("blog/2233-03-22/index.md")) == Path("blog/index.j2")
+    assert index.find(Path("blog/kirk_is_born.md")) == Path("blog/kirk_is_born.j2")
+
+    (tmp_path / "pages").mkdir()
+    (tmp_path / "pages" / "index.j2").write_text("{{ page.content }}")
+    assert index.find(Path("pages/about.md")) == Path("index.j2"), "Scanned once"
+
+
+def test_theme_index_no_template(tmp_path: Path):
+    with pytest.raises(FileNotFoundError, match="No template for 'pages/about.md'"):
+        ThemeIndex(tmp_path).find(Path("pages/about.md"))
+
+
+def test_theme_compile(tmp_path: Path, monkeypatch):
+    shutil.copyfile(
+        Path(__file__).parent.parent / "werd/templates/config.yaml",
+        tmp_path / "config.yaml",
+    )
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "theme").mkdir(exist_ok=True)
+    (tmp_path / "theme" / "base.j2").write_text("<p>{% block content %}{% endblock %}")
+    (tmp_path / "theme" / "index.j2").write_text('{% extends "base.j2" %}')
+
+    result = CliRunner().invoke(cli, ["theme", "compile"])
+
+    assert result.exit_code == 0
+    assert result.output.startswith("Compiled 2 templates")
+    assert len(list(BYTECODE_CACHE.iterdir())) == 2
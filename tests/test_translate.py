@@ -1,4 +1,6 @@
+import hashlib
 import os
+import pickle
 import shutil
 from pathlib import Path
 
@@ -7,9 +9,15 @@ import responses
 from click.testing import CliRunner
 from dotenv import load_dotenv
 
+import werd.translate
 from werd.cli import cli
 from werd.config import ConfigModel
-from werd.translate import translate_content
+from werd.translate import (
+    TranslationPlan,
+    print_plan,
+    translate_content,
+    translate_strings,
+)
 
 
 def setup_std_test_env_dir(tmp_path: Path):
@@ -84,3 +92,165 @@ def test_translate_function(tmp_path: Path):
 
     Path(".hash").unlink(missing_ok=True)
     shutil.rmtree("_translations")
+
+
+def test_translate_strings_batch(monkeypatch):
+    """Should translate all the strings in one request."""
+    requests = []
+
+    def fake_request_completion(messages, backend=None):
+        requests.append(messages)
+        return '```json\n[["blog", "Blog"], ["about us", "Über uns"]]\n```'
+
+    monkeypatch.setattr(werd.translate, "request_completion", fake_request_completion)
+
+    assert translate_strings(["blog", "about us"], "en", "de") == ["Blog", "Über uns"]
+    assert len(requests) == 1
+
+
+def test_translate_strings_fallback(monkeypatch):
+    """Should translate mismatched strings one at a time."""
+    monkeypatch.setattr(
+        werd.translate,
+        "request_completion",
+        lambda messages, backend=None: '[["blog", "Blog"], ["a-team", "das A-Team"], ["x", ""]]',
+    )
+    singles = []
+
+    def fake_translate_string(
+        string, source_lang, target_lang, no_markdown=False, backend=None
+    ):
+        singles.append(string)
+        return f"<{string}>"
+
+    monkeypatch.setattr(werd.translate, "translate_string", fake_translate_string)
+
+    assert translate_strings(["blog", "about us", "x"], "en", "de") == [
+        "Blog",
+        "<about us>",
+        "<x>",
+    ]
+    assert singles == ["about us", "x"]
+
+    monkeypatch.setattr(werd.translate, "request_completion", lambda m, b=None: "Nein!")
+    assert translate_strings(["blog"], "en", "de") == ["<blog>"]
+
+
+def test_translate_plan(tmp_path: Path, site, stub_server):
+    """Should estimate everything to translate without calling the model."""
+    config = site
+    config.language.output.insert(1, "jp")
+
+    plan = TranslationPlan(config, readonly=True)
+    estimates = plan.estimates()
+
+    assert len(plan.files) == 4
+    assert {e.lang for e in estimates} == {"jp", "de"}
+    assert len([e for e in estimates if e.name.endswith("strings")]) == 2
+    assert len(estimates) == 2 + 4 * 2, "Strings and every file in each language"
+    assert all(e.input_tokens and e.output_tokens for e in estimates)
+
+    print_plan(plan, concurrency=2)
+    assert not stub_server.requests, "Should not call the model when planning"
+    assert not (tmp_path / "_translations").exists()
+    assert not (tmp_path / ".werd").exists()
+
+
+def test_translate_plan_fan_out_context_window(site):
+    """Fan outs are split to fit the prompt and reply in the model's context."""
+    config = site
+    config.language.output = ["de", "jp", "fr"]
+    config.translate.fan_out = True
+    config.translate.fan_out_max_tokens = 1000000
+    config.backend.context_window = 1000000
+    fan_outs = TranslationPlan(config).fan_outs
+    assert fan_outs and all(len(f.langs) == 3 for f in fan_outs)
+
+    config.backend.context_window = min(f.tokens() for f in fan_outs) - 1
+    fan_outs = TranslationPlan(config).fan_outs
+    assert fan_outs and all(len(f.langs) == 2 for f in fan_outs)
+    assert all(f.tokens() <= config.backend.context_window for f in fan_outs)
+
+
+def test_translate_new_language_and_pruning(tmp_path: Path, site, capsys):
+    """Only missing (file, language) pairs are translated, orphans are removed."""
+    config = site
+    translate_content(config)
+    assert not TranslationPlan(config).jobs, "Nothing changed"
+
+    config.language.output.append("jp")
+    plan = TranslationPlan(config)
+    assert len(plan.jobs) == 4
+    assert {lang for _, lang in plan.jobs} == {"jp"}
+    plan.run()
+
+    rendered = tmp_path / "output" / "de" / "pages" / "a-team.html"
+    rendered.parent.mkdir(parents=True)
+    rendered.write_text("<html></html>")
+    (tmp_path / "content" / "pages" / "a-team.md").rename(
+        tmp_path / "content" / "pages" / "b-team.md"
+    )
+    plan = TranslationPlan(config)
+    assert {file.name for file, _ in plan.jobs} == {"b-team.md"}
+    assert len(plan.orphans) == 3
+    print_plan(plan)
+    assert "Would remove 3 translations" in capsys.readouterr().out
+    plan.run()
+
+    for lang in ["en", "de", "jp"]:
+        pages = tmp_path / "_translations" / lang / "pages"
+        assert [file.name for file in pages.iterdir()] == ["b-team.md"]
+    assert not rendered.exists()
+
+    shutil.rmtree(tmp_path / "content" / "pages")  # A whole directory
+    plan = TranslationPlan(config)
+    assert len(plan.orphans) == 3
+    plan.run()
+    assert not (tmp_path / "_translations" / "de" / "pages").exists()
+
+    shutil.rmtree(tmp_path / "content")  # e.g. the wrong directory
+    (tmp_path / "content").mkdir()
+    assert not TranslationPlan(config).orphans, "Not everything"
+
+
+def test_translate_legacy_hashes(tmp_path: Path, site, stub_server):
+    """Files translated by older versions of werd aren't translated again."""
+    config = site
+    files = sorted((tmp_path / "content").glob("**/*.md"))
+    hashes = {}
+    for file in files:
+        rel_path = file.relative_to(tmp_path)
+        hashes[str(rel_path)] = hashlib.md5(file.read_text().encode()).hexdigest()
+        for lang in ["en", "de"]:
+            translation = (
+                tmp_path / "_translations" / lang / rel_path.relative_to("content")
+            )
+            translation.parent.mkdir(parents=True, exist_ok=True)
+            translation.write_text(file.read_text())
+    (tmp_path / ".hash").write_bytes(pickle.dumps(hashes))
+    edited = files[0]
+    edited.write_text(edited.read_text() + "\nEdited.\n")
+
+    plan = TranslationPlan(config)
+    assert {file for file, _ in plan.jobs} == {edited.relative_to(tmp_path)}
+
+    config.language.output.append("jp")
+    plan = TranslationPlan(config)
+    assert len(plan.jobs) == len(files) + 2, "No jp translations to import"
+
+
+def test_translate_shared_segments(tmp_path: Path, site, stub_server):
+    """A segment in several files is only translated once."""
+    for name in ["a", "b", "c"]:
+        (tmp_path / "content" / f"{name}.md").write_text(
+            f"# {name}\n\nAll our pages end like this.\n"
+        )
+
+    translate_content(site)
+
+    sent = [r["messages"][-2]["content"] for r in stub_server.requests]
+    assert sum("All our pages end like this." in m for m in sent) == 1
+    for name in ["a", "b", "c"]:
+        assert (tmp_path / "_translations" / "de" / f"{name}.md").read_text() == (
+            f"# {name.upper()}\n\nALL OUR PAGES END LIKE THIS.\n"
+        )
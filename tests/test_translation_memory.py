@@ -0,0 +1,116 @@
+import json
+
+import werd.translate
+from werd.translate import translate_document
+from werd.translation_memory import TranslationMemory, join_segments, split_segments
+
+DOCUMENT = """# The A-Team
+
+In 1972, a crack commando unit was sent to prison.
+They promptly escaped.
+
+- Hannibal
+- Face
+  the charming one
+- B.A.
+
+| Name | Rank |
+|------|------|
+| John | Colonel |
+
+```python
+print("I love it when a plan comes together")
+
+print("again")
+```
+"""
+
+
+def test_split_segments():
+    blocks, gaps = split_segments(DOCUMENT)
+
+    assert blocks[0] == "# The A-Team"
+    assert blocks[1].endswith("They promptly escaped.")
+    assert blocks[2:5] == ["- Hannibal", "- Face\n  the charming one", "- B.A."]
+    assert blocks[5].count("\n") == 2, "Table should be one segment"
+    assert blocks[6].startswith("```") and blocks[6].endswith("```")
+    assert len(blocks) == 7
+    assert join_segments(blocks, gaps) == DOCUMENT
+
+
+def test_translate_document_only_sends_missing_segments(
+    tmp_path, monkeypatch, char_tokens
+):
+    requests = []
+
+    def fake_translate_string(
+        content, source_lang, target_lang, no_markdown=False, context="", backend=None
+    ):
+        requests.append(content)
+        return "\n\n".join(f"{b} [{target_lang}]" for b in split_segments(content)[0])
+
+    monkeypatch.setattr(werd.translate, "translate_string", fake_translate_string)
+    memory = TranslationMemory(tmp_path / "memory.json")
+
+    first = translate_document(DOCUMENT, "en", "de", memory)
+    assert first.startswith("# The A-Team [de]\n\nIn 1972")
+    assert len(requests) == 1
+
+    assert translate_document(DOCUMENT, "en", "de", memory) == first
+    assert len(requests) == 1, "Should not translate anything already known"
+
+    edited = DOCUMENT.replace("They promptly", "They quickly")
+    translate_document(edited, "en", "de", memory)
+    assert len(requests) == 2
+    assert requests[-1] == (
+        "In 1972, a crack commando unit was sent to prison.\nThey quickly escaped."
+    )
+
+    memory.save()
+    assert TranslationMemory(tmp_path / "memory.json").get(
+        "- Face\n  the charming one", "de"
+    )
+
+
+def test_translate_document_in_chunks(tmp_path, monkeypatch, char_tokens):
+    requests = []
+
+    def fake_translate_string(
+        content, source_lang, target_lang, no_markdown=False, context="", backend=None
+    ):
+        requests.append((content, context))
+        return content.upper()
+
+    monkeypatch.setattr(werd.translate, "translate_string", fake_translate_string)
+    memory = TranslationMemory(tmp_path / "memory.json")
+
+    translated = translate_document(
+        DOCUMENT, "en", "de", memory, chunk_tokens=100, concurrency=3
+    )
+
+    assert translated == DOCUMENT.upper()
+    assert len(requests) > 1, "Should split the document into several chunks"
+    for content, context in requests:
+        if content.startswith("# The A-Team"):
+            assert context == "", "First chunk has no preceding context"
+        else:
+            assert context, "Later chunks should get the preceding text"
+
+
+def test_memory_versions(tmp_path):
+    path = tmp_path / "memory.json"
+    memory = TranslationMemory(path)
+    memory.add("Hello", "de", "Hallo")  # From before versions
+    memory.save()
+
+    memory = TranslationMemory(path, "gpt-4o/1")
+    assert memory.get("Hello", "de") == "Hallo", "Not paid for again"
+    memory.add("Bye", "de", "Tschüss")
+    memory.save()
+    assert list(json.loads(path.read_text())) == ["de@gpt-4o/1"]
+
+    memory = TranslationMemory(path, "gpt-4o/2")
+    assert memory.get("Hello", "de") is None
+    memory.add("Bye", "de", "Ciao")
+    memory.save()
+    assert list(json.loads(path.read_text())) == ["de@gpt-4o/2"], "Old ones pruned"
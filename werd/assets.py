@@ -0,0 +1,300 @@
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+from functools import partial
+from pathlib import Path
+
+from werd.content_tracker import CHUNK_SIZE, ContentTracker
+from werd.files import write_bytes_atomic
+from werd.scheduler import Job, run_jobs
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def file_hash(path: Path) -> str:
+    checksum = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def is_unchanged(source: Path, dest: Path) -> bool:
+    """
+    Does dest already have the source's content? Same size and mtime is
+    enough, otherwise the same size and hash (and then the mtime is copied).
+    """
+    try:
+        dest_stat = dest.stat()
+    except FileNotFoundError:
+        return False
+    source_stat = source.stat()
+    if source_stat.st_size != dest_stat.st_size:
+        return False
+    if source_stat.st_mtime_ns == dest_stat.st_mtime_ns:
+        return True
+    if file_hash(source) != file_hash(dest):
+        return False
+    os.utime(dest, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+    return True
+
+
+def copy_asset(source: Path, dest: Path, link: bool = False) -> None:
+    """
+    Hard link (if asked to and possible) or copy the source into place with
+    its mode and mtime. `shutil.copyfile` copies in the kernel (sendfile) where it can.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        linked = False
+        if link:
+            try:
+                os.unlink(tmp)
+                os.link(source, tmp)
+                linked = True
+            except OSError:
+                pass  # e.g. another file system, so copy it
+        if not linked:
+            shutil.copyfile(source, tmp)
+            shutil.copymode(source, tmp)  # Not mkstemp's 0600
+            stat = source.stat()
+            os.utime(tmp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp, dest)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def collect_assets(sources: list[Path]) -> dict[Path, Path]:
+    """
+    The files of the source directories merged together, later ones
+    overriding earlier ones, by their path relative to their directory.
+    """
+    files = {}
+    for source_dir in sources:
+        for file in sorted(source_dir.glob("**/*")):
+            if file.is_file():
+                files[file.relative_to(source_dir)] = file
+    return files
+
+
+def fingerprinted(rel_path: Path, checksum: str) -> Path:
+    """e.g. css/site.css -> css/site.0123456789.css"""
+    return rel_path.with_name(f"{rel_path.stem}.{checksum[:10]}{rel_path.suffix}")
+
+
+def sync_assets(
+    files: dict[Path, Path],
+    dest_dir: Path,
+    concurrency: int = 8,
+    link: bool = False,
+    siblings: tuple[str, ...] = (),
+) -> tuple[int, int, int]:
+    """
+    Make dest_dir hold the files, given as {path in dest_dir: source file}.
+    Only copies the files that changed, in parallel, and removes any others
+    except the compressed copies (with the `siblings` suffixes) of the files.
+    Returns the number of files copied, unchanged and removed.
+    """
+    jobs = [
+        Job(
+            key=rel_path,
+            fn=partial(copy_asset, source, dest_dir / rel_path, link),
+            cost=source.stat().st_size,
+        )
+        for rel_path, source in files.items()
+        if not is_unchanged(source, dest_dir / rel_path)
+    ]
+    run_jobs(jobs, concurrency, progress=False)
+
+    removed = 0
+    if dest_dir.exists():
+        for file in sorted(dest_dir.glob("**/*"), reverse=True):  # Files first
+            if file.is_dir():
+                if not any(file.iterdir()):
+                    file.rmdir()
+                continue
+            rel_path = file.relative_to(dest_dir)
+            if rel_path in files or (
+                rel_path.suffix in siblings and rel_path.with_suffix("") in files
+            ):
+                continue
+            file.unlink()
+            removed += 1
+
+    return len(jobs), len(files) - len(jobs), removed
+
+
+def gzip_compress(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=9, mtime=0)  # Same bytes every time
+
+
+def brotli_compress(data: bytes) -> bytes:
+    return brotli.compress(data, quality=11)
+
+
+def zstd_compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=19).compress(data)
+
+
+# Encoding: (file suffix, compress function, module needed or None if missing)
+COMPRESSORS = {
+    "gzip": (".gz", gzip_compress, gzip),
+    "brotli": (".br", brotli_compress, brotli),
+    "zstd": (".zst", zstd_compress, zstandard),
+}
+COMPRESSED_SUFFIXES = tuple(suffix for suffix, _, _ in COMPRESSORS.values())
+# HTML, CSS, JS and feeds
+COMPRESSIBLE = {
+    ".html",
+    ".css",
+    ".js",
+    ".mjs",
+    ".svg",
+    ".json",
+    ".xml",
+    ".rss",
+    ".atom",
+}
+
+
+class CompressedFiles:
+    """
+    Which content (hash) of each file was compressed into each encoding, in
+    its own table of the `ContentTracker` database that hashes the files.
+    Changes are written by `save`.
+    """
+
+    def __init__(self, db_path):
+        self.tracker = ContentTracker(db_path)
+        self.db = self.tracker.db
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS compressed ("
+            "path TEXT, encoding TEXT, hash TEXT, PRIMARY KEY (path, encoding))"
+        )
+        self.compressed = {
+            (path, encoding): hash
+            for path, encoding, hash in self.db.execute(
+                "SELECT path, encoding, hash FROM compressed"
+            )
+        }
+        self.dirty = set()
+        self.forgotten = set()
+
+    def checksum(self, file: Path) -> str:
+        return self.tracker.checksum(file)
+
+    def is_current(self, file: Path, encoding: str) -> bool:
+        """Was the file's current content compressed into the encoding?"""
+        return self.compressed.get((str(file), encoding)) == self.checksum(file)
+
+    def update(self, file: Path, encoding: str, checksum: str) -> None:
+        key = (str(file), encoding)
+        self.compressed[key] = checksum
+        self.dirty.add(key)
+        self.forgotten.discard(key)
+
+    def forget(self, path: str, encoding: str) -> None:
+        key = (path, encoding)
+        self.compressed.pop(key, None)
+        self.dirty.discard(key)
+        self.forgotten.add(key)
+
+    def save(self) -> None:
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO compressed VALUES (?, ?, ?)",
+                [(*key, self.compressed[key]) for key in self.dirty],
+            )
+            self.db.executemany(
+                "DELETE FROM compressed WHERE path = ? AND encoding = ?",
+                self.forgotten,
+            )
+        self.dirty.clear()
+        self.forgotten.clear()
+        for path in self.tracker.paths():
+            if not os.path.exists(path):
+                self.tracker.forget(path)
+        self.tracker.save()
+
+    def close(self) -> None:
+        self.save()
+        self.db.close()
+
+
+def compress_file(file: Path, encoding: str) -> None:
+    suffix, compress, _ = COMPRESSORS[encoding]
+    write_bytes_atomic(file.with_name(file.name + suffix), compress(file.read_bytes()))
+
+
+def compress_files(
+    root: Path, encodings: list[str], state: CompressedFiles, concurrency: int = 8
+) -> tuple[int, int]:
+    """
+    Write compressed copies of the compressible files under root next to them
+    (e.g. index.html.gz), in parallel. Files whose hash has not changed since
+    they were compressed, as recorded in `state`, are skipped. The compressed
+    copies written before, of files that no longer exist or in encodings no
+    longer wanted, are removed. Returns the number of files compressed and
+    removed.
+    """
+    for encoding in encodings:
+        if encoding not in COMPRESSORS:
+            raise ValueError(
+                f"Unknown compression '{encoding}'. Try one of: {', '.join(COMPRESSORS)}"
+            )
+        if COMPRESSORS[encoding][2] is None:
+            raise ValueError(
+                f"{encoding} compression needs an optional package, "
+                "try `pip install werd[compress]`"
+            )
+
+    def compressed(file: Path, encoding: str, checksum: str, _) -> None:
+        state.update(file, encoding, checksum)
+
+    # Only the compressed copies we wrote, so not any shipped as assets
+    removed = 0
+    for path, encoding in list(state.compressed):
+        file = Path(path)
+        if encoding not in encodings or not file.exists():
+            sibling = file.with_name(file.name + COMPRESSORS[encoding][0])
+            if sibling.exists():
+                sibling.unlink()
+                removed += 1
+            state.forget(path, encoding)
+
+    jobs = []
+    for file in sorted(root.glob("**/*")) if encodings else []:
+        if not file.is_file() or file.suffix not in COMPRESSIBLE:
+            continue
+        checksum = state.checksum(file)
+        for encoding in encodings:
+            sibling = file.with_name(file.name + COMPRESSORS[encoding][0])
+            if not state.is_current(file, encoding) or not sibling.exists():
+                jobs.append(
+                    Job(
+                        key=(file, encoding),
+                        fn=partial(compress_file, file, encoding),
+                        cost=file.stat().st_size,
+                        on_done=partial(compressed, file, encoding, checksum),
+                    )
+                )
+
+    try:
+        run_jobs(jobs, concurrency, progress=False)
+    finally:
+        state.save()
+    return len(jobs), removed
@@ -0,0 +1,322 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Iterator
+
+import openai
+from openai import OpenAI
+
+from werd.cache import TranslationCache
+from werd.config import BackendConfig
+from werd.rate_limit import RateLimiter, backoff
+from werd.scheduler import report_tokens
+
+NOT_IMPLEMENTED = "You should implement this."
+
+
+class TransientError(Exception):
+    """A request failed in a way that is worth retrying."""
+
+    def __init__(self, message: str = "", retry_after: float = 0.0) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after  # Seconds, if the backend told us
+
+
+class RateLimitedError(TransientError):
+    """The backend asked us to slow down."""
+
+
+class BackendTimeoutError(TransientError):
+    """The request timed out or the connection failed."""
+
+
+class CassetteMissError(LookupError):
+    """A replayed request was never recorded."""
+
+
+class Backend(ABC):
+    """
+    Where translation requests are sent. A backend is created once per run
+    and shared by all the translation worker threads.
+    """
+
+    def __init__(self, config: BackendConfig) -> None:
+        self.config = config
+
+    @property
+    def model(self) -> str:
+        return self.config.model
+
+    @abstractmethod
+    def complete(self, messages: list[dict], max_tokens: int) -> str:
+        """Send the chat messages and return the reply."""
+        raise NotImplementedError(NOT_IMPLEMENTED)
+
+    def stream(self, messages: list[dict], max_tokens: int) -> Iterator[str]:
+        """Send the chat messages and yield the reply as it arrives."""
+        yield self.complete(messages, max_tokens)
+
+
+clients: dict[tuple, OpenAI] = {}
+clients_lock = threading.Lock()
+
+
+def shared_client(config: BackendConfig) -> OpenAI:
+    """
+    One long lived OpenAI client per server, so every request of the process
+    shares its pool of kept-alive connections instead of paying for a new
+    connection and TLS handshake each time.
+    """
+    key = (config.base_url, config.api_key_env, config.timeout)
+    with clients_lock:
+        if key not in clients:
+            clients[key] = OpenAI(
+                base_url=config.base_url,
+                # Local servers usually don't check the key but the client needs one
+                api_key=os.getenv(config.api_key_env)
+                or ("not-needed" if config.base_url else None),
+                timeout=config.timeout,
+                max_retries=0,  # See RateLimitedBackend
+            )
+        return clients[key]
+
+
+class OpenAIBackend(Backend):
+    """
+    OpenAI's chat completions API, or any server with an OpenAI compatible API
+    (e.g. vLLM, llama.cpp's server) when `base_url` is set.
+    """
+
+    def __init__(self, config: BackendConfig) -> None:
+        super().__init__(config)
+        self.client = shared_client(config)
+
+    def complete(self, messages: list[dict], max_tokens: int) -> str:
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+            )
+        except openai.RateLimitError as e:
+            raise RateLimitedError(str(e), retry_after(e.response)) from e
+        except (openai.APITimeoutError, openai.APIConnectionError) as e:
+            raise BackendTimeoutError(str(e)) from e
+        except openai.InternalServerError as e:
+            raise TransientError(str(e), retry_after(e.response)) from e
+        return response.choices[0].message.content
+
+    def stream(self, messages: list[dict], max_tokens: int) -> Iterator[str]:
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=True,
+                # Give up if nothing arrives for this long
+                timeout=self.config.stall_timeout,
+            )
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except openai.RateLimitError as e:
+            raise RateLimitedError(str(e), retry_after(e.response)) from e
+        except (openai.APITimeoutError, openai.APIConnectionError) as e:
+            raise BackendTimeoutError(str(e)) from e
+        except openai.InternalServerError as e:
+            raise TransientError(str(e), retry_after(e.response)) from e
+
+
+def retry_after(response) -> float:
+    """Seconds to wait from a response's Retry-After header, if any."""
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+def request_key(model: str, messages: list[dict]) -> str:
+    """Hash identifying a request in a cassette."""
+    return hashlib.sha256(
+        json.dumps([model, messages], sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+class RecordingBackend(Backend):
+    """
+    Passes requests on to another backend and appends each request and its
+    reply to a cassette file (JSON lines) that `ReplayBackend` can serve.
+    """
+
+    def __init__(self, config: BackendConfig, backend: Backend) -> None:
+        super().__init__(config)
+        self.backend = backend
+        self.cassette = Path(config.record)
+        self.cassette.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def record(self, messages: list[dict], reply: str) -> None:
+        record = {
+            "key": request_key(self.model, messages),
+            "model": self.model,
+            "messages": messages,
+            "reply": reply,
+        }
+        with self.lock, self.cassette.open("a", encoding="utf8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def complete(self, messages: list[dict], max_tokens: int) -> str:
+        reply = self.backend.complete(messages, max_tokens)
+        self.record(messages, reply)
+        return reply
+
+    def stream(self, messages: list[dict], max_tokens: int) -> Iterator[str]:
+        chunks = []
+        for chunk in self.backend.stream(messages, max_tokens):
+            chunks.append(chunk)
+            yield chunk
+        self.record(messages, "".join(chunks))
+
+
+class CachingBackend(Backend):
+    """
+    Answers requests from the translation cache when it can and caches the
+    replies of the backend it wraps, so the same text with the same prompt,
+    languages and model is only ever paid for once.
+    """
+
+    def __init__(
+        self, config: BackendConfig, backend: Backend, cache: TranslationCache
+    ) -> None:
+        super().__init__(config)
+        self.backend = backend
+        self.cache = cache
+
+    def complete(self, messages: list[dict], max_tokens: int) -> str:
+        key = request_key(self.model, messages)
+        reply = self.cache.get(key)
+        if reply is None:
+            reply = self.backend.complete(messages, max_tokens)
+            self.cache.put(key, reply)
+        return reply
+
+
+class StreamingBackend(Backend):
+    """
+    Streams the reply of the backend it wraps, reporting the tokens as they
+    arrive for the live throughput display. Streamed requests give up when
+    nothing arrives for `stall_timeout` seconds, so a stalled request is
+    retried rather than holding a worker until the overall timeout.
+    """
+
+    def __init__(self, config: BackendConfig, backend: Backend) -> None:
+        super().__init__(config)
+        self.backend = backend
+
+    def complete(self, messages: list[dict], max_tokens: int) -> str:
+        chunks = []
+        for chunk in self.backend.stream(messages, max_tokens):
+            chunks.append(chunk)
+            report_tokens()
+        return "".join(chunks)
+
+
+class RateLimitedBackend(Backend):
+    """
+    Sends requests through a `RateLimiter` and retries transient errors with
+    jittered exponential backoff, up to `max_retries` times. `count_tokens`
+    counts a request's prompt tokens for the tokens per minute quota.
+    """
+
+    def __init__(
+        self,
+        config: BackendConfig,
+        backend: Backend,
+        limiter: RateLimiter,
+        count_tokens: Callable[[list[dict]], int],
+    ) -> None:
+        super().__init__(config)
+        self.backend = backend
+        self.limiter = limiter
+        self.count_tokens = count_tokens
+
+    def complete(self, messages: list[dict], max_tokens: int) -> str:
+        # Quotas count the tokens asked for as well as the prompt
+        tokens = self.count_tokens(messages) + max_tokens
+        for attempt in range(self.config.max_retries + 1):
+            self.limiter.acquire(tokens)
+            try:
+                reply = self.backend.complete(messages, max_tokens)
+            except TransientError as e:
+                self.limiter.release(throttled=isinstance(e, RateLimitedError))
+                if attempt == self.config.max_retries:
+                    raise
+                time.sleep(backoff(attempt, retry_after=e.retry_after))
+            except BaseException:
+                self.limiter.release()
+                raise
+            else:
+                self.limiter.release()
+                return reply
+
+
+class ReplayBackend(Backend):
+    """
+    Serves the replies recorded in a cassette without any network, optionally
+    adding latency and rate limit errors to simulate a real backend.
+    """
+
+    def __init__(self, config: BackendConfig) -> None:
+        super().__init__(config)
+        if not config.cassette:
+            raise ValueError("The replay backend needs a backend.cassette file.")
+        self.replies = {}
+        for line in Path(config.cassette).read_text("utf8").splitlines():
+            if line.strip():
+                record = json.loads(line)
+                self.replies[record["key"]] = record["reply"]
+        self.random = random.Random(0)  # Same errors every run
+
+    def complete(self, messages: list[dict], max_tokens: int) -> str:
+        if self.config.replay_latency:
+            time.sleep(self.config.replay_latency)
+        if self.random.random() < self.config.replay_error_rate:
+            raise RateLimitedError("Simulated rate limit error")
+        try:
+            return self.replies[request_key(self.model, messages)]
+        except KeyError:
+            raise CassetteMissError(
+                f"Request not found in cassette {self.config.cassette}"
+            )
+
+    def stream(self, messages: list[dict], max_tokens: int) -> Iterator[str]:
+        reply = self.complete(messages, max_tokens)
+        for i in range(0, len(reply), 16):
+            yield reply[i : i + 16]
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "openai-compatible": OpenAIBackend,
+    "replay": ReplayBackend,
+}
+
+
+def get_backend(config: BackendConfig) -> Backend:
+    """Create the backend the config asks for, recording it if asked to."""
+    try:
+        backend_class = BACKENDS[config.provider]
+    except KeyError:
+        raise ValueError(
+            f"Unknown translation backend provider '{config.provider}'. "
+            f"Try one of: {', '.join(BACKENDS)}"
+        )
+    backend = backend_class(config)
+    if config.record:
+        backend = RecordingBackend(config, backend)
+    return backend
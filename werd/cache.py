@@ -0,0 +1,75 @@
+import os
+from pathlib import Path
+from typing import Optional
+
+from werd.files import open_atomic
+
+
+class TranslationCache:
+    """
+    Content addressed on-disk store of model replies (and of converted
+    markdown, see `MarkdownConverter`). Each reply is a file
+    named after the hash of its request, under a sub-directory named after the
+    first two characters of the hash. A file's mtime is bumped on every hit so
+    `prune` can evict the least recently used first. Entries are only synced
+    to disk if `sync`, as cheap ones can just be made again after a crash.
+    """
+
+    def __init__(self, path: Path, max_size: int, sync: bool = True) -> None:
+        self.path = Path(path)
+        self.max_size = max_size  # bytes
+        self.sync = sync
+
+    @classmethod
+    def from_config(cls, cache_config) -> "TranslationCache":
+        return cls(cache_config.dir, cache_config.max_size_mb * 1024 * 1024)
+
+    def file(self, key: str) -> Path:
+        return self.path / key[:2] / key
+
+    def get(self, key: str) -> Optional[str]:
+        file = self.file(key)
+        try:
+            reply = file.read_text("utf8")
+        except FileNotFoundError:
+            return None
+        os.utime(file)
+        return reply
+
+    def put(self, key: str, reply: str) -> None:
+        file = self.file(key)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        with open_atomic(file, sync=self.sync) as f:
+            f.write(reply)
+
+    def entries(self) -> list[tuple[os.stat_result, Path]]:
+        return [
+            (file.stat(), file)
+            for file in self.path.glob("*/*")
+            if file.is_file() and file.suffix != ".tmp"
+        ]
+
+    def stats(self) -> tuple[int, int]:
+        """Number of entries and their total size in bytes."""
+        entries = self.entries()
+        return len(entries), sum(stat.st_size for stat, _ in entries)
+
+    def prune(self, max_size: Optional[int] = None) -> tuple[int, int]:
+        """
+        Remove the least recently used entries until the cache is no bigger
+        than max_size (defaults to the cache's max_size) bytes. Returns the
+        number of entries and bytes removed.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        files = sorted(self.entries(), key=lambda entry: entry[0].st_mtime)
+        size = sum(stat.st_size for stat, _ in files)
+        removed, removed_size = 0, 0
+        for stat, file in files:
+            if size <= max_size:
+                break
+            file.unlink(missing_ok=True)
+            size -= stat.st_size
+            removed += 1
+            removed_size += stat.st_size
+
+        return removed, removed_size
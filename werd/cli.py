@@ -56,10 +56,34 @@ def init() -> None:
     required=False,
     help="Force translate a comma seperated list of languages.",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    required=False,
+    help="Max. number of translation requests to run at once.",
+)
+@click.option(
+    "--plan",
+    is_flag=True,
+    help="Only show what would be translated and estimate the tokens, cost and time.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue an interrupted run with just the files it had left to do.",
+)
 @click.pass_context
-def translate(ctx: click.Context, all: bool, langs: Optional[str]) -> None:
+def translate(
+    ctx: click.Context,
+    all: bool,
+    langs: Optional[str],
+    jobs: Optional[int],
+    plan: bool,
+    resume: bool,
+) -> None:
     "Translate the source markdown files into the target languages."
-    from werd.translate import translate_content
+    from werd.translate import TranslationPlan, print_plan, translate_content
 
     langs_list: list[str] = []
     if langs:
@@ -69,13 +93,86 @@ def translate(ctx: click.Context, all: bool, langs: Optional[str]) -> None:
     if all:
         click.echo("Translating all content files.")
 
-    translate_content(ctx.obj["config"], all, langs_list)
+    if plan:
+        config = ctx.obj["config"]
+        translation_plan = TranslationPlan(
+            config, all, langs_list, resume, readonly=True
+        )
+        print_plan(translation_plan, jobs)
+    else:
+        translate_content(ctx.obj["config"], all, langs_list, jobs, resume)
 
 
 @cli.command(name="render")
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes to render with.",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Render every page, even if nothing it depends on has changed.",
+)
 @click.pass_context
-def render_content(ctx: click.Context) -> None:
+def render_content(ctx: click.Context, jobs: int, force: bool) -> None:
     """Render the translated markdown files into HTML."""
     from werd.render import render_content
 
-    render_content(ctx.obj["config"])
+    render_content(ctx.obj["config"], jobs, force)
+
+
+@cli.group(name="theme")
+def theme() -> None:
+    "Manage the theme's templates."
+
+
+@theme.command(name="compile")
+@click.pass_context
+def theme_compile(ctx: click.Context) -> None:
+    "Compile every template of the theme into the bytecode cache."
+    from werd.theme import BYTECODE_CACHE, compile_templates, theme_environment
+
+    count = compile_templates(theme_environment(ctx.obj["config"]))
+    click.echo(f"Compiled {count} templates into {BYTECODE_CACHE}")
+
+
+@cli.group(name="cache")
+def cache() -> None:
+    "Manage the cache of model translations."
+
+
+@cache.command(name="stats")
+@click.pass_context
+def cache_stats(ctx: click.Context) -> None:
+    "Show how many translations are cached and their size."
+    from werd.cache import TranslationCache
+
+    config = ctx.obj["config"]
+    entries, size = TranslationCache.from_config(config.cache).stats()
+    click.echo(
+        f"{entries} cached translations, {size / 1024 / 1024:.1f} MB "
+        f"of max. {config.cache.max_size_mb} MB in {config.cache.dir}"
+    )
+
+
+@cache.command(name="prune")
+@click.option(
+    "--max-size",
+    type=click.IntRange(min=0),
+    required=False,
+    help="Prune down to this many MB (defaults to cache.max_size_mb, 0 to clear).",
+)
+@click.pass_context
+def cache_prune(ctx: click.Context, max_size: Optional[int]) -> None:
+    "Remove the least recently used translations until the cache fits."
+    from werd.cache import TranslationCache
+
+    config = ctx.obj["config"]
+    removed, size = TranslationCache.from_config(config.cache).prune(
+        None if max_size is None else max_size * 1024 * 1024
+    )
+    click.echo(f"Removed {removed} cached translations, {size / 1024 / 1024:.1f} MB")
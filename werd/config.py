@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 
 import yaml
 from pydantic import BaseModel, validator
@@ -22,6 +22,18 @@ language:
 theme_name: something
 content_dir: content
 translations_dir: _translations
+
+translate:
+  concurrency: 8
+
+backend:
+  provider: openai-compatible
+  base_url: http://localhost:8000/v1
+  model: llama-3-70b-instruct
+  concurrency: 32
+
+render:
+  output: minify
 """
 
 
@@ -31,6 +43,66 @@ class LanguageConfig(BaseModel):
     output: list[str]
 
 
+class TranslateConfig(BaseModel):
+    concurrency: int = 4  # Max. number of translation requests in flight
+    strings_batch_size: int = 100  # Max. strings (titles etc.) per request
+    chunk_tokens: int = 2000  # Max. source tokens per request for large files
+    chunk_context_tokens: int = 200  # Preceding text sent along for context
+    stream: bool = False  # Stream replies to show live progress, detect stalls
+    # Translate short files into several languages per request
+    fan_out: bool = False
+    fan_out_max_tokens: int = 4000  # Max. expected reply size of those requests
+    # Used by `werd translate --plan` to estimate the cost and time
+    input_cost: float = 0.06  # USD per 1000 input tokens
+    output_cost: float = 0.12  # USD per 1000 output tokens
+    output_tokens_per_second: float = 30.0  # Per request
+    request_latency: float = 1.0  # Seconds before the first token
+
+
+class BackendConfig(BaseModel):
+    provider: str = "openai"  # or "openai-compatible" for self hosted servers
+    base_url: Optional[str] = None  # e.g. http://localhost:8000/v1
+    model: str = "gpt-4-32k"
+    context_window: int = 32768  # Max. prompt plus reply tokens of the model
+    api_key_env: str = "OPENAI_API_KEY"  # Environment variable with the API key
+    concurrency: Optional[int] = None  # Defaults to translate.concurrency
+    timeout: float = 600.0  # Seconds per request
+    stall_timeout: float = 60.0  # Seconds without a streamed token, see stream
+    requests_per_minute: Optional[int] = None  # Quotas, unlimited if not set
+    tokens_per_minute: Optional[int] = None
+    max_retries: int = 6  # For rate limited, timed out and server errors
+    record: Optional[Path] = None  # Record every request/reply to this cassette
+    # The "replay" provider serves the replies recorded in a cassette
+    cassette: Optional[Path] = None
+    replay_latency: float = 0.0  # Seconds added to every replayed request
+    replay_error_rate: float = 0.0  # Fraction of requests to fail as rate limited
+
+
+class CacheConfig(BaseModel):
+    enabled: bool = True
+    dir: Path = Path(".werd/cache")
+    max_size_mb: int = 1024  # Least recently used replies are pruned after that
+
+
+class RenderConfig(BaseModel):
+    # How pages are written: "pretty" (indented), "minify" or "raw" (as rendered)
+    output: Literal["raw", "minify", "pretty"] = "pretty"
+    # Python-Markdown extensions, e.g. ["tables", "fenced_code"], and their options
+    markdown_extensions: list[str] = []
+    markdown_extension_configs: dict[str, dict] = {}
+    # Converted markdown is cached here, pruned down to this size (0 for no cache)
+    markdown_cache_dir: Path = Path(".werd/markdown")
+    markdown_cache_mb: int = 256
+    asset_jobs: int = 8  # Assets copied at once
+    # Hard link the assets into the output rather than copy them, if possible
+    link_assets: bool = False
+    # Add a hash of their content to the asset file names, see `asset_url()`
+    fingerprint_assets: bool = False
+    # Write compressed copies of the HTML, CSS, JS and feeds next to them,
+    # brotli and zstd need `pip install werd[compress]`
+    compress: list[Literal["gzip", "brotli", "zstd"]] = []
+
+
 class ConfigModel(BaseModel):
     site_name: dict[str, str]
     language: LanguageConfig
@@ -39,6 +111,10 @@ class ConfigModel(BaseModel):
     output_dir: Path = Path("output")
     theme_dir: Path = Path("theme")
     translations_dir: Path = Path("_translations")
+    translate: TranslateConfig = TranslateConfig()
+    backend: BackendConfig = BackendConfig()
+    cache: CacheConfig = CacheConfig()
+    render: RenderConfig = RenderConfig()
 
     @validator("content_dir", "translations_dir", "theme_dir")
     def validate_dir(cls, v):
@@ -1,39 +1,159 @@
 import hashlib
-import pickle
+import os
+import sqlite3
 from pathlib import Path
+from typing import Optional
+
+CHUNK_SIZE = 1024 * 1024
 
 
 class ContentTracker:
-    """Class to check for changes in the content of a file."""
+    """
+    Class to check for changes in the content of a file.
+
+    Keeps, in a SQLite database, the content hash of each file with its stat
+    (mtime, size and inode) so a file is only read and hashed when its stat
+    changes, and which hash and version of each file every language was last
+    translated from. Changes are kept in memory and written in one transaction
+    by `save`. A `readonly` tracker (e.g. for planning) never creates or
+    changes the database.
+    """
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, readonly: bool = False):
         """Initialize."""
         self.db_path = Path(db_path)
-        try:
-            self.hash = pickle.load(self.db_path.open("rb"))
-        except IOError:
-            self.hash = {}
+        self.readonly = readonly
+        # Whether this is the first run, e.g. to import older state
+        self.created = not self.db_path.exists()
+        if readonly and self.created:
+            self.db = sqlite3.connect(":memory:")
+        elif readonly:
+            self.db = sqlite3.connect(
+                f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True
+            )
+        else:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(self.db_path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, "
+            "inode INTEGER, hash TEXT)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "path TEXT, lang TEXT, version TEXT, hash TEXT, "
+            "PRIMARY KEY (path, lang))"
+        )
+        self.files = {
+            path: (mtime_ns, size, inode, hash)
+            for path, mtime_ns, size, inode, hash in self.db.execute(
+                "SELECT path, mtime_ns, size, inode, hash FROM files"
+            )
+        }
+        self.translations = {
+            (path, lang): (version, hash)
+            for path, lang, version, hash in self.db.execute(
+                "SELECT path, lang, version, hash FROM translations"
+            )
+        }
+        self.dirty_files = set()
+        self.dirty_translations = set()
+        self.forgotten = set()
+
+    @staticmethod
+    def get_stat(filepath: str) -> tuple[int, int, int]:
+        stat = os.stat(filepath)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
 
     def get_checksum(self, filepath: str):
-        """Get the checksum of a file."""
-        return hashlib.md5(open(filepath).read().encode("utf-8")).hexdigest()
+        """Get the checksum of a file, reading it in chunks."""
+        checksum = hashlib.blake2b(digest_size=16)
+        with open(filepath, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                checksum.update(chunk)
+        return checksum.hexdigest()
+
+    def checksum(self, filepath: str) -> str:
+        """The file's checksum, only read again if its stat has changed."""
+        filepath = str(filepath)
+        stat = self.get_stat(filepath)
+        if filepath in self.files and self.files[filepath][:3] == stat:
+            return self.files[filepath][3]
+
+        checksum = self.get_checksum(filepath)
+        self.files[filepath] = (*stat, checksum)
+        self.dirty_files.add(filepath)
+        return checksum
 
     def save(self):
-        """Save the hash."""
-        pickle.dump(self.hash, self.db_path.open("wb"))
+        """Write all the changes since the last save in one transaction."""
+        if self.readonly:
+            return
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                [(path, *self.files[path]) for path in self.dirty_files],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+                [(*key, *self.translations[key]) for key in self.dirty_translations],
+            )
+            self.db.executemany(
+                "DELETE FROM files WHERE path = ?", [(p,) for p in self.forgotten]
+            )
+            self.db.executemany(
+                "DELETE FROM translations WHERE path = ?",
+                [(p,) for p in self.forgotten],
+            )
+        self.dirty_files.clear()
+        self.dirty_translations.clear()
+        self.forgotten.clear()
 
-    def update(self, filepath: str):
-        """Update the hash with new file path."""
-        filepath = str(filepath)
-        self.hash[filepath] = self.get_checksum(filepath)
+    def close(self):
         self.save()
+        self.db.close()
 
-    def has_changed(self, filepath: str):
-        """Check if content has changed or we don't know about it yet."""
+    def update(
+        self,
+        filepath: str,
+        lang: str = "",
+        version: str = "",
+        checksum: Optional[str] = None,
+    ):
+        """
+        Record the file as translated into lang with the given version, from
+        its current content or else the content with the given checksum.
+        """
         filepath = str(filepath)
-        if filepath not in self.hash or self.hash[filepath] != self.get_checksum(
-            filepath
-        ):
-            return True
-        else:
-            return False
+        self.translations[filepath, lang] = (
+            version,
+            checksum or self.checksum(filepath),
+        )
+        self.dirty_translations.add((filepath, lang))
+
+    def has_changed(self, filepath: str, lang: str = "", version: str = ""):
+        """
+        Check if content has changed since it was translated into lang with
+        this version, or we don't know about it yet.
+        """
+        filepath = str(filepath)
+        return self.translations.get((filepath, lang)) != (
+            version,
+            self.checksum(filepath),
+        )
+
+    def paths(self) -> set[str]:
+        """All the files tracked."""
+        return set(self.files) | {path for path, _ in self.translations}
+
+    def forget(self, filepath: str):
+        """Stop tracking a file, e.g. because it was deleted."""
+        filepath = str(filepath)
+        self.files.pop(filepath, None)
+        for key in [key for key in self.translations if key[0] == filepath]:
+            del self.translations[key]
+        self.dirty_files.discard(filepath)
+        self.dirty_translations = {
+            key for key in self.dirty_translations if key[0] != filepath
+        }
+        self.forgotten.add(filepath)
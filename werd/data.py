@@ -11,8 +11,7 @@ different outputs.
 
 from datetime import datetime
 from pathlib import Path
-
-from pydantic import BaseModel
+from typing import Any
 
 # Visitor Design Pattern
 # see: https://stackoverflow.com/a/25895156/196732
@@ -51,11 +50,31 @@ class FileSystemNode(Node):
         return visitor.visit(self, kids)
 
 
-class Page(BaseModel):
-    href: str
-    lang: str
-    title: str
-    filepath: Path
+class Page:
+    """
+    A page of the site. Plain slotted classes rather than pydantic models, as
+    there are many of them and nothing to validate.
+    """
+
+    __slots__ = ("href", "lang", "title", "filepath")
+
+    def __init__(self, href: str, lang: str, title: str, filepath: Path) -> None:
+        self.href = href
+        self.lang = lang
+        self.title = title
+        self.filepath = filepath
+
+    def fields(self) -> dict:
+        """The page's own data, not its content or subpages."""
+        return {
+            name: getattr(self, name)
+            for cls in type(self).__mro__
+            for name in getattr(cls, "__slots__", ())
+            if not name.startswith("_") and name != "subpages"
+        }
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(href={self.href!r})"
 
     def accept(self, visitor):
         visitor.visit(self)
@@ -64,21 +83,80 @@ class Page(BaseModel):
                 page.accept(visitor)
 
 
-class ContentPage(Page):
-    content: str
+class LazyContent:
+    """
+    The HTML content is only converted from the markdown `source` file when
+    it is used, and kept until `release`d, so a tree of pages only holds
+    their metadata. Pages using this have `source`, `_converter` and
+    `_content` slots.
+    """
+
+    __slots__ = ()
+
+    def init_content(self, source: Path, converter: Any = None) -> None:
+        self.source = source
+        self._converter = converter
+        self._content = None
+
+    @property
+    def content(self) -> str:
+        if self._content is None:
+            text = self.source.read_text()
+            self._content = self._converter.convert(text) if self._converter else text
+        return self._content
+
+    def release(self) -> None:
+        self._content = None
+
+
+class ContentPage(LazyContent, Page):
+    __slots__ = ("source", "_converter", "_content")
+
+    def __init__(self, source: Path, converter: Any = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.init_content(source, converter)
 
 
 class BlogPost(ContentPage):
-    date: datetime
+    __slots__ = ("date",)
+
+    def __init__(self, date: datetime, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.date = date
 
 
 class IndexPage(Page):
-    subpages: list[Page]
+    __slots__ = ("subpages",)
+
+    def __init__(self, subpages: list[Page], **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.subpages = subpages
+
 
+class ContentIndexPage(LazyContent, Page):
+    """
+    An index page with the content of its home page (one of its subpages),
+    shared with it so it is only converted once. The content is released
+    with the home page's.
+    """
 
-class ContentIndexPage(Page):
-    content: str
-    subpages: list[Page]
+    __slots__ = ("_home_page", "subpages")
+
+    def __init__(self, home_page: ContentPage, subpages: list[Page], **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._home_page = home_page
+        self.subpages = subpages
+
+    @property
+    def source(self) -> Path:
+        return self._home_page.source
+
+    @property
+    def content(self) -> str:
+        return self._home_page.content
+
+    def release(self) -> None:
+        pass
 
 
 if __name__ == "__main__":
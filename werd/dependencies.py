@@ -0,0 +1,109 @@
+"""
+What each rendered page depends on, so `werd render` only renders the pages
+whose inputs changed since the last build.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+from jinja2 import Environment, TemplateNotFound, meta
+
+from werd import __version__
+from werd.files import write_text_atomic
+
+
+def digest(*parts) -> str:
+    """Hash of some JSON serialisable values."""
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+def template_digest(env: Environment, name: str, digests: dict) -> str:
+    """
+    Hash of a template and every template it extends, includes or imports,
+    memoised in `digests`.
+    """
+    if name not in digests:
+        digests[name] = ""  # In case of cycles
+        try:
+            source, _, _ = env.loader.get_source(env, name)
+        except TemplateNotFound:
+            return digests[name]
+        references = sorted(
+            template
+            for template in meta.find_referenced_templates(env.parse(source))
+            if template  # Not known until rendered if None
+        )
+        digests[name] = digest(
+            source, [template_digest(env, t, digests) for t in references]
+        )
+    return digests[name]
+
+
+def tree_fingerprint(dirs: Iterable[Path], *extra) -> str:
+    """
+    Hash of the path, modification time and size of every file in the dirs.
+    Only stats the files, so it is quick to work out.
+    """
+    files = []
+    for root in dirs:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                stat = os.stat(path)
+                files.append((path, stat.st_mtime_ns, stat.st_size))
+    return digest(__version__, files, *extra)
+
+
+def file_stat(path: str) -> Optional[list[int]]:
+    """The modification time and size of the file, None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class RenderState:
+    """
+    The build fingerprint, the inputs key of every output file from the last
+    render and the stat of every file written, kept in a JSON file.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.fingerprint: Optional[str] = None
+        self.outputs: dict[str, str] = {}  # output path: inputs key
+        self.stats: dict[str, list[int]] = {}  # output path: mtime and size
+        if self.path.exists():
+            state = json.loads(self.path.read_text())
+            self.fingerprint = state["fingerprint"]
+            self.outputs = state["outputs"]
+            self.stats = state.get("stats", {})
+
+    def intact(self) -> set[str]:
+        """The output files that are still as they were written."""
+        return {path for path, stat in self.stats.items() if file_stat(path) == stat}
+
+    def record_stats(self, paths: Iterable[str]) -> None:
+        self.stats = {
+            path: stat for path in paths if (stat := file_stat(path)) is not None
+        }
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(
+            self.path,
+            json.dumps(
+                {
+                    "fingerprint": self.fingerprint,
+                    "outputs": self.outputs,
+                    "stats": self.stats,
+                }
+            ),
+        )
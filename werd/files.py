@@ -0,0 +1,52 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+# Read once, as reading it means setting it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def file_mode(path: Path) -> int:
+    """The mode of the file, or that of a new file if it doesn't exist."""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    """
+    Write the text to a temp file next to path and rename it into place, so
+    the file is never seen half written, even if we crash or lose power.
+    """
+    write_bytes_atomic(path, text.encode("utf8"))
+
+
+def write_bytes_atomic(path: Path, data: bytes) -> None:
+    """Like `write_text_atomic` for bytes."""
+    with open_atomic(path, "wb") as f:
+        f.write(data)
+
+
+@contextmanager
+def open_atomic(path: Path, mode: str = "w", sync: bool = True):
+    """
+    Open a temp file next to path to write, renamed into place when closed
+    without an error. Skip the fsync with `sync=False` if losing power
+    meanwhile doesn't matter, e.g. for files that can be generated again.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else "utf8") as f:
+            yield f
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+            os.fchmod(f.fileno(), file_mode(path))  # Not mkstemp's 0600
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
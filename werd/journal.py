@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Iterator
+
+from werd.files import write_text_atomic
+
+
+class Journal:
+    """
+    Durable log of a translation run: a first line with every planned
+    (file, language) job, then a line for each job as it is finished. If the
+    run dies the jobs still pending can be picked up with `werd translate
+    --resume`, and the finished ones recorded as translated. The journal is
+    removed once a run finishes.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def start(self, jobs: list[tuple[str, str]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_text_atomic(self.path, json.dumps({"planned": jobs}) + "\n")
+
+    def done(self, file: str, lang: str, version: str = "", checksum: str = "") -> None:
+        """Log a finished job, with the version and source checksum it was from."""
+        entry = {"done": [file, lang], "version": version, "checksum": checksum}
+        with self.lock, self.path.open("a", encoding="utf8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def entries(self) -> Iterator[dict]:
+        if not self.exists():
+            return
+        with self.path.open(encoding="utf8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return  # Half written last line of a crashed run
+
+    def pending(self) -> list[tuple[str, str]]:
+        """The planned jobs not done yet, in the order they were planned."""
+        planned, done = [], set()
+        for entry in self.entries():
+            if "planned" in entry:
+                planned = [tuple(job) for job in entry["planned"]]
+            else:
+                done.add(tuple(entry["done"]))
+        return [job for job in planned if job not in done]
+
+    def finished(self) -> list[tuple[str, str, str, str]]:
+        """The (file, lang, version, checksum) of every job done."""
+        return [
+            (*entry["done"], entry["version"], entry["checksum"])
+            for entry in self.entries()
+            if entry.get("checksum")
+        ]
+
+    def finish(self) -> None:
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,57 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+
+import markdown
+
+from werd.cache import TranslationCache
+
+
+class MarkdownConverter:
+    """
+    One Markdown instance, reset between documents, with the configured
+    extensions. The HTML of every document is cached on disk by a hash of its
+    text, the extensions and the Markdown version, so unchanged documents are
+    not parsed again.
+    """
+
+    def __init__(
+        self,
+        extensions: Optional[list[str]] = None,
+        extension_configs: Optional[dict] = None,
+        cache: Optional[TranslationCache] = None,
+    ) -> None:
+        extensions = extensions or []
+        extension_configs = extension_configs or {}
+        self.md = markdown.Markdown(
+            extensions=extensions, extension_configs=extension_configs
+        )
+        self.options = json.dumps(
+            [markdown.__version__, extensions, extension_configs], sort_keys=True
+        )
+        self.cache = cache
+
+    @classmethod
+    def from_config(cls, render_config) -> "MarkdownConverter":
+        cache = None
+        if render_config.markdown_cache_mb:
+            cache = TranslationCache(
+                Path(render_config.markdown_cache_dir),
+                render_config.markdown_cache_mb * 1024 * 1024,
+                sync=False,  # Quick to convert again
+            )
+        return cls(
+            render_config.markdown_extensions,
+            render_config.markdown_extension_configs,
+            cache,
+        )
+
+    def convert(self, text: str) -> str:
+        key = hashlib.sha256(f"{self.options}\0{text}".encode()).hexdigest()
+        html = self.cache.get(key) if self.cache else None
+        if html is None:
+            html = self.md.reset().convert(text)
+            if self.cache:
+                self.cache.put(key, html)
+        return html
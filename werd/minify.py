@@ -0,0 +1,48 @@
+import re
+
+# Elements whose content is left exactly as is
+PRESERVED_RE = re.compile(
+    r"(<(pre|textarea|script|style)\b.*?</\2\s*>)", re.IGNORECASE | re.DOTALL
+)
+COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)  # Not IE conditionals
+# A tag, with quoted attribute values that may contain ">"
+TAG_RE = re.compile(r"""<[a-zA-Z/!](?:[^>"']|"[^"]*"|'[^']*')*>""")
+SPACE_RE = re.compile(r"\s+")
+TAG_SPACE_RE = re.compile(r"""("[^"]*"|'[^']*')|\s+""")
+
+
+def collapse(match: re.Match) -> str:
+    return "\n" if "\n" in match.group() else " "
+
+
+def collapse_tag(match: re.Match) -> str:
+    """Leave quoted attribute values alone."""
+    return match.group(1) if match.group(1) is not None else collapse(match)
+
+
+def minify_text(text: str) -> str:
+    text = COMMENT_RE.sub("", text)
+    minified, position = [], 0
+    for tag in TAG_RE.finditer(text):
+        minified.append(SPACE_RE.sub(collapse, text[position : tag.start()]))
+        minified.append(TAG_SPACE_RE.sub(collapse_tag, tag.group()))
+        position = tag.end()
+    minified.append(SPACE_RE.sub(collapse, text[position:]))
+    return "".join(minified)
+
+
+def minify_html(html: str) -> str:
+    """
+    Remove comments and collapse every run of whitespace to a single space
+    (or newline), outside of pre, textarea, script and style elements and
+    quoted attribute values. Never removes whitespace altogether, so the page
+    looks the same.
+    """
+    parts = PRESERVED_RE.split(html)
+    minified = []
+    # split() gives text, preserved element, tag name, text, ...
+    for i in range(0, len(parts), 3):
+        minified.append(minify_text(parts[i]))
+        if i + 1 < len(parts):
+            minified.append(parts[i + 1])
+    return "".join(minified).strip()
@@ -0,0 +1,80 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+WINDOW = 60.0  # Seconds, quotas are per minute
+
+
+class RateLimiter:
+    """
+    Keeps requests within a requests and tokens per minute quota and adapts
+    how many requests can be in flight at once: it grows by about one every
+    `limit` successful requests and halves whenever the backend throttles us
+    (additive increase, multiplicative decrease).
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_concurrency: int = 4,
+        min_concurrency: int = 1,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.active = 0
+        self.sent: deque[tuple[float, int]] = deque()  # (time, tokens)
+        self.condition = threading.Condition()
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until a request of this many tokens could go, 0 if now."""
+        while self.sent and self.sent[0][0] <= now - WINDOW:
+            self.sent.popleft()
+
+        if self.active >= int(self.limit):
+            return WINDOW  # Until notified by a `release`
+        if self.requests_per_minute and len(self.sent) >= self.requests_per_minute:
+            return self.sent[0][0] + WINDOW - now
+        if self.tokens_per_minute and self.sent:
+            used = sum(t for _, t in self.sent)
+            if used + tokens > self.tokens_per_minute:
+                # Wait for enough of the window to expire
+                for sent_at, sent_tokens in self.sent:
+                    used -= sent_tokens
+                    if used + tokens <= self.tokens_per_minute:
+                        return sent_at + WINDOW - now
+        return 0.0
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Block until a request of this many tokens is within all the limits."""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                wait = self.wait_time(tokens, now)
+                if wait <= 0:
+                    break
+                self.condition.wait(wait)
+            self.active += 1
+            self.sent.append((now, tokens))
+
+    def release(self, throttled: bool = False) -> None:
+        """A request finished; `throttled` if the backend told us to slow down."""
+        with self.condition:
+            self.active -= 1
+            if throttled:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+def backoff(
+    attempt: int, base: float = 1.0, cap: float = 60.0, retry_after: float = 0.0
+) -> float:
+    """Seconds to wait before retry number `attempt` (from 0), with full jitter."""
+    return max(retry_after, random.uniform(0, min(cap, base * 2**attempt)))
@@ -1,28 +1,60 @@
 import json
 import os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from functools import partial
 from pathlib import Path
+from typing import Optional
 
 from bs4 import BeautifulSoup
-from jinja2 import Environment, FileSystemLoader
-from markdown import markdown
+from jinja2 import Environment, Template
 
 from werd import PACKAGEDIR
+from werd.assets import (
+    COMPRESSED_SUFFIXES,
+    CompressedFiles,
+    collect_assets,
+    compress_files,
+    fingerprinted,
+    sync_assets,
+)
+from werd.content_tracker import ContentTracker
 from werd.data import (
     BlogPost,
     ContentIndexPage,
     ContentPage,
     FileSystemNode,
     IndexPage,
+    LazyContent,
     Page,
     Visitor,
 )
+from werd.dependencies import RenderState, digest, template_digest, tree_fingerprint
+from werd.files import open_atomic
+from werd.markdown_converter import MarkdownConverter
+from werd.minify import minify_html
 from werd.strings_map import StringMap
-
-
-def find_template_file(config: dict, rel_file: Path):
+from werd.theme import ThemeIndex, compile_templates, theme_environment
+
+RENDER_STATE = Path(".werd") / "render.json"
+ASSET_TRACKER = Path(".werd") / "assets.db"
+COMPRESS_TRACKER = Path(".werd") / "compressed.db"
+RENDER_SETTINGS = {
+    "site_name",
+    "language",
+    "index_page",
+    "content_dir",
+    "output_dir",
+    "theme_dir",
+    "translations_dir",
+    "render",
+}
+
+
+def find_template_file(
+    config: dict, rel_file: Path, theme_index: Optional[ThemeIndex] = None
+):
     """
     Schema is from most specfic to least specific:
 
@@ -39,50 +71,82 @@ def find_template_file(config: dict, rel_file: Path):
     3. themes/<theme>/<category>.j2
     4. themes/<theme>/<name>.j2
     5. themes/<theme>/index.j2
-    """
 
-    def get_stems(stem: str, parent: str) -> list[str]:
-        return [f"{stem}.j2", "index.j2"] + ([f"{parent}.j2"] if parent else [])
-
-    # Most specific to least
-    candidates = []
-    for parent in rel_file.parents:
-        candidates += [parent / c for c in get_stems(rel_file.stem, parent.name)]
-
-    # Find the first one that exists
-    for c in candidates:
-        theme_file = config.theme_dir / c
-        if theme_file.exists():
-            break
-
-    return theme_file.relative_to(config.theme_dir)
+    Pass a `theme_index` to reuse one scan of the theme for many files.
+    """
+    return (theme_index or ThemeIndex(config.theme_dir)).find(rel_file)
 
 
-def copy_static_assets(config: dict):
+def copy_static_assets(config: dict) -> dict[str, str]:
     """
-    Copy all static assets from the theme directory to the output directory.
+    Sync the static assets of the theme and the content (which override the
+    theme's) into the output directory.
+
+    Returns the path of each asset in the output by its path in the assets
+    directory. With `render.fingerprint_assets` the output names have a hash
+    of their content in them, so they can be cached forever. The assets are
+    kept under their own names too, for the links in the content and the
+    `url()`s in stylesheets.
     """
+    print("Copying static assets...")
+    files = collect_assets([config.theme_dir / "assets", config.content_dir / "assets"])
+    if config.render.fingerprint_assets:
+        tracker = ContentTracker(ASSET_TRACKER)
+        names = {
+            rel_path: fingerprinted(rel_path, tracker.checksum(source))
+            for rel_path, source in files.items()
+        }
+        for path in tracker.paths():
+            if not Path(path).exists():
+                tracker.forget(path)
+        tracker.close()
+    else:
+        names = {rel_path: rel_path for rel_path in files}
+
+    outputs = {names[rel_path]: source for rel_path, source in files.items()}
+    copied, unchanged, removed = sync_assets(
+        {**files, **outputs},
+        config.output_dir / "assets",
+        config.render.asset_jobs,
+        config.render.link_assets,
+        siblings=COMPRESSED_SUFFIXES,
+    )
+    print(f"{copied} copied, {unchanged} unchanged, {removed} removed.")
+    return {rel_path.as_posix(): name.as_posix() for rel_path, name in names.items()}
 
-    def copy_assets(src_dir: Path, dest_dir: Path):
-        for file in (src_dir / "assets").glob("**/*"):
-            if file.is_file():
-                rel_path = file.relative_to(src_dir)
-                save_path = dest_dir / rel_path
-                save_path.parent.mkdir(parents=True, exist_ok=True)
-                save_path.write_bytes(file.read_bytes())
 
-    print("Copying theme static assets...")
-    copy_assets(config.theme_dir, config.output_dir)
-    print("Copying content static assets...")
-    copy_assets(config.content_dir, config.output_dir)
+def compress_output(config: dict):
+    """
+    Write the compressed copies of the output files in `render.compress`
+    encodings, and remove those no longer wanted.
+    """
+    if not config.render.compress and not COMPRESS_TRACKER.exists():
+        return  # Never compressed anything
+    if config.render.compress:
+        print("Compressing output...")
+    state = CompressedFiles(COMPRESS_TRACKER)
+    try:
+        compressed, removed = compress_files(
+            config.output_dir,
+            config.render.compress,
+            state,
+            config.render.asset_jobs,
+        )
+    finally:
+        state.close()
+    if config.render.compress:
+        print(f"{compressed} compressed, {removed} removed.")
 
 
-def get_layout_content(lang, config: dict):
+def get_layout_content(
+    lang, config: dict, converter: Optional[MarkdownConverter] = None
+):
     """Looks for a _layout dir and renders it as HTML from markdown."""
+    converter = converter or MarkdownConverter.from_config(config.render)
     root = config.translations_dir / lang / "_layout"
     if root.exists():
         return {
-            child.stem: markdown(child.read_text())
+            child.stem: converter.convert(child.read_text())
             for child in root.iterdir()
             if child.is_file()
         }
@@ -102,19 +166,31 @@ class PageTree(Visitor):
     Build a tree of Page objects from a given content directory.
     Should encapsulate the logical view of the website so ideally use many different
     renderer classes to produce different formats as output.
+
+    Pages only hold their metadata, their content is read and converted when
+    it is rendered (see `LazyContent`).
     """
 
-    def __init__(self, lang, config: dict, string_map: StringMap):
+    def __init__(
+        self,
+        lang,
+        config: dict,
+        string_map: StringMap,
+        converter: Optional[MarkdownConverter] = None,
+    ):
         self.lang = lang
         self.config = config
         self.string_map = string_map
+        self.converter = converter or MarkdownConverter.from_config(config.render)
 
     def find_index_subpage(self, subpages: list[FileSystemNode]):
         """Search the given subpages for an spcially named index page."""
         try:
             # Find the index replacement page in subpages if it exists
             return next(
-                s for s in subpages if s.filepath.stem == self.config.index_page
+                s
+                for s in subpages
+                if s is not None and s.filepath.stem == self.config.index_page
             )
         except StopIteration:
             return False
@@ -140,8 +216,8 @@ class PageTree(Visitor):
                         / "index.html"
                     ),
                     lang=self.lang,
-                    content=home_page.content,
-                    subpages=subpages,
+                    home_page=home_page,
+                    subpages=[s for s in subpages if s is not None],
                 )
             else:
                 # Not a special index page, so just return a normal index page
@@ -157,8 +233,6 @@ class PageTree(Visitor):
                 )
         else:
             if node.path.suffix == ".md":
-                content = markdown(node.path.read_text())
-
                 if node.is_a("blog"):
                     return BlogPost(
                         title=title,
@@ -168,7 +242,8 @@ class PageTree(Visitor):
                             / "index.html"
                         ),
                         lang=self.lang,
-                        content=content,
+                        source=node.path,
+                        converter=self.converter,
                         filepath=node.path,
                         date=datetime.strptime(node.path.parent.name, "%Y-%m-%d"),
                     )
@@ -181,27 +256,84 @@ class PageTree(Visitor):
                             ).with_suffix(".html")
                         ),
                         lang=self.lang,
-                        content=content,
+                        source=node.path,
+                        converter=self.converter,
                         filepath=node.path,
                     )
 
 
 class HtmlPageRenderer(Visitor):
-    """Transverses a Page tree and renders each Page as a HTML file."""
+    """
+    Transverses a Page tree and renders each Page as a HTML file.
+
+    To split the work, only every `batches`th page from the `batch`th is
+    rendered. Pages whose inputs key is the same as in `previous` (from the
+    last render) are not rendered again. The keys of all the pages visited are
+    collected in `outputs`.
+    """
 
-    def __init__(self, lang, config, root: Page, layout_content: dict[str, str]):
+    def __init__(
+        self,
+        lang,
+        config,
+        root: Page,
+        layout_content: dict[str, str],
+        env: Optional[Environment] = None,
+        batch: int = 0,
+        batches: int = 1,
+        previous: Optional[dict[str, str]] = None,
+        template_digests: Optional[dict] = None,
+        theme_index: Optional[ThemeIndex] = None,
+    ):
         self.config = config
         self.lang = lang
         self.all_languages = get_languages()
         self.root = root
         self.layout_content = layout_content
-        self.env = Environment(loader=FileSystemLoader(config.theme_dir))
+        self.env = env or theme_environment(config)
+        self.batch = batch
+        self.batches = batches
+        self.visited = 0
+        self.previous = {} if previous is None else previous
+        self.template_digests = {} if template_digests is None else template_digests
+        self.theme_index = theme_index or ThemeIndex(config.theme_dir)
+        self.outputs = {}
+        self.rendered = 0
+        # What every page of the language depends on
+        self.inputs_key = digest(
+            render_settings(config),
+            layout_content,
+            list(page_index(root)),
+            self.env.globals.get("assets"),
+        )
 
     def visit(self, page: Page):
+        self.visited += 1
+        try:
+            if (self.visited - 1) % self.batches == self.batch:
+                self.render_page(page)
+        finally:
+            # Don't hold on to the content of every page visited, whether it
+            # was rendered or not (an index page showing it could have
+            # converted it). Not that of subpages, which are visited later.
+            if isinstance(page, LazyContent):
+                page.release()
+
+    def render_page(self, page: Page):
         """
         Can do matching here and handle each of the Page types differently.
         """
-        theme_file = find_template_file(self.config, page.filepath)
+        theme_file = find_template_file(self.config, page.filepath, self.theme_index)
+        save_path = self.config.output_dir / page.href
+        key = digest(
+            self.inputs_key,
+            template_digest(self.env, str(theme_file), self.template_digests),
+            list(page_inputs(page)),
+        )
+        self.outputs[str(save_path)] = key
+        if self.previous.get(str(save_path)) == key and save_path.exists():
+            return
+
         template = self.env.get_template(str(theme_file))
 
         site_name = (
@@ -210,9 +342,9 @@ class HtmlPageRenderer(Visitor):
             else self.config.site_name[self.config.language.default]
         )
 
-        # Render the HTML
+        # Render and save the HTML
 
-        html = template.render(
+        context = dict(
             page=page,
             subpages=page.subpages if hasattr(page, "subpages") else [],
             config=self.config,
@@ -224,13 +356,44 @@ class HtmlPageRenderer(Visitor):
             supported_languages=self.config.language.output,
             layout=self.layout_content,
         )
+        write_page(save_path, template, context, self.config.render.output)
+        self.rendered += 1
 
-        # Save the HTML
 
-        html = BeautifulSoup(html, "html.parser").prettify(formatter="html5")
-        save_path = self.config.output_dir / page.href
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        save_path.write_text(html)
+def write_page(path: Path, template: Template, context: dict, output: str) -> None:
+    """
+    Render the template into the file in the `render.output` mode. Written
+    to a temp file first, so a failed render never leaves half a page.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open_atomic(path, sync=False) as f:
+        if output == "raw":
+            f.writelines(template.generate(context))
+        elif output == "minify":
+            f.write(minify_html(template.render(context)))
+        else:
+            html = template.render(context)
+            f.write(BeautifulSoup(html, "html.parser").prettify(formatter="html5"))
+
+
+def page_inputs(page: Page):
+    """
+    The page's data and markdown, and those of its subpages, which templates
+    can show too (but not of theirs).
+    """
+    for subpage in [page, *getattr(page, "subpages", [])]:
+        if subpage is not None:
+            yield subpage.fields()
+            if isinstance(subpage, LazyContent):
+                yield subpage.source.read_text()
+
+
+def page_index(page: Page):
+    """The href and title of every page in the tree, for the navigation."""
+    yield page.href, page.title
+    for subpage in getattr(page, "subpages", []):
+        if subpage is not None:
+            yield from page_index(subpage)
 
 
 class RssRenderer(Visitor):
@@ -239,39 +402,165 @@ class RssRenderer(Visitor):
     ...
 
 
-def render_content(config: dict):
-    """Translates content and renders HTML."""
-    # assert config.theme_dir.exists(), f"Theme directory '{config.theme_dir}' not found?"
+# The render state of each process, see `init_worker`
+worker = {}
+
+
+def init_worker(
+    config: dict,
+    previous: dict[str, str],
+    assets: Optional[dict[str, str]] = None,
+    env: Optional[Environment] = None,
+    theme_index: Optional[ThemeIndex] = None,
+) -> None:
+    """
+    Set up a process to render pages. Forked workers inherit the parent's
+    compiled templates and theme index, others make their own.
+    """
+    worker["config"] = config
+    worker["previous"] = previous
+    worker["env"] = env or worker.get("env") or theme_environment(config, assets)
+    worker["theme_index"] = (
+        theme_index or worker.get("theme_index") or ThemeIndex(config.theme_dir)
+    )
+    worker["strings_map"] = StringMap(config, readonly=True)
+    worker["template_digests"] = {}
+    worker["converter"] = MarkdownConverter.from_config(config.render)
+
+
+def render_pages(
+    lang: str, batch: int = 0, batches: int = 1
+) -> tuple[dict[str, str], int]:
+    """
+    Render the `batch`th of `batches` parts of a language's pages. Returns
+    the inputs key of each page and how many pages had to be rendered.
+    """
+    config = worker["config"]
+
+    # Build the page tree
 
-    for lang in config.language.output:
-        # Build the page tree
+    root = config.translations_dir / lang
+    root_node = FileSystemNode(root)
+    page_tree = root_node.accept(
+        PageTree(lang, config, worker["strings_map"], worker["converter"])
+    )
 
-        root = config.translations_dir / lang
-        root_node = FileSystemNode(root)
-        page_tree = root_node.accept(PageTree(lang, config, StringMap(config)))
+    # Get the layout content
 
-        # Get the layout content
+    layout_content = get_layout_content(lang, config, worker["converter"])
 
-        layout_content = get_layout_content(lang, config)
+    # Render the HTML
 
-        # Render the HTML
+    renderer = HtmlPageRenderer(
+        lang,
+        config,
+        page_tree,
+        layout_content,
+        worker["env"],
+        batch,
+        batches,
+        worker["previous"],
+        worker["template_digests"],
+        worker["theme_index"],
+    )
+    page_tree.accept(renderer)
+    return renderer.outputs, renderer.rendered
 
-        page_tree.accept(HtmlPageRenderer(lang, config, page_tree, layout_content))
 
-    # Static assets
+def render_settings(config: dict) -> dict:
+    """The settings a render depends on, not those for translating."""
+    return config.model_dump(include=RENDER_SETTINGS)
 
-    copy_static_assets(config)
+
+def build_fingerprint(config: dict) -> str:
+    """Changes if any file a render depends on might have changed."""
+    return tree_fingerprint(
+        [config.translations_dir, config.theme_dir, config.content_dir / "assets"],
+        render_settings(config),
+    )
+
+
+def render_content(config: dict, jobs: int = 1, force: bool = False):
+    """
+    Translates content and renders HTML, on `jobs` processes at once. The
+    languages are split into about `jobs` parts in all, rendered in parallel.
+
+    Only the pages whose inputs changed since the last render, or whose
+    output file was changed or deleted, are rendered unless `force`d. Nothing
+    at all is rendered if no file they could depend on has changed.
+    """
+    # assert config.theme_dir.exists(), f"Theme directory '{config.theme_dir}' not found?"
+
+    state = RenderState(RENDER_STATE)
+    fingerprint = build_fingerprint(config)
+    intact = set() if force else state.intact()
+    if state.fingerprint == fingerprint and state.stats and intact == set(state.stats):
+        print("Nothing has changed since the last render.")
+        return
+    previous = {path: key for path, key in state.outputs.items() if path in intact}
+
+    # Static assets, first so the pages can link to their fingerprinted names
+
+    assets = copy_static_assets(config)
+
+    env = theme_environment(config, assets)
+    theme_index = ThemeIndex(config.theme_dir)
+    langs = config.language.output
+    batches = -(-jobs // len(langs)) if langs else 1  # Per language
+    tasks = [(lang, batch, batches) for lang in langs for batch in range(batches)]
+
+    if jobs > 1:
+        compile_templates(env)
+        # Before forking the workers
+        worker["env"] = env
+        worker["theme_index"] = theme_index
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=init_worker,
+            initargs=(config, previous, assets),
+        ) as executor:
+            results = [
+                future.result()
+                for future in [executor.submit(render_pages, *task) for task in tasks]
+            ]
+    else:
+        init_worker(config, previous, assets, env, theme_index)
+        results = [render_pages(*task) for task in tasks]
+
+    outputs = {}
+    for pages, _ in results:
+        outputs.update(pages)
+    print(f"Rendered {sum(n for _, n in results)} of {len(outputs)} pages.")
+
+    converter = MarkdownConverter.from_config(config.render)
+    layout_content = get_layout_content(langs[-1], config, converter) if langs else {}
+    if converter.cache:
+        converter.cache.prune()
 
     # Landing page
 
-    env = Environment(loader=FileSystemLoader(config.theme_dir))
-    template = env.get_template("landing.j2")
-    html = template.render(
-        title=config.site_name[config.language.default],
-        lang=config.language.default,
-        config=config,
-        languages=get_languages(),
-        supported_languages=config.language.output,
-        layout=layout_content,
+    landing_page = config.output_dir / "index.html"
+    write_page(
+        landing_page,
+        env.get_template("landing.j2"),
+        dict(
+            title=config.site_name[config.language.default],
+            lang=config.language.default,
+            config=config,
+            languages=get_languages(),
+            supported_languages=config.language.output,
+            layout=layout_content,
+        ),
+        config.render.output,
     )
-    (config.output_dir / "index.html").write_text(html)
+
+    compress_output(config)
+
+    # Unless something changed while rendering
+    if build_fingerprint(config) == fingerprint:
+        state.fingerprint = fingerprint
+    else:
+        state.fingerprint = None
+    state.outputs = outputs
+    state.record_stats([*outputs, str(landing_page)])
+    state.save()
@@ -0,0 +1,170 @@
+import heapq
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable, Optional
+
+# The job running in each worker thread, for `report_tokens`
+current = threading.local()
+
+
+@dataclass
+class Job:
+    """
+    A unit of work for the scheduler.
+
+    `cost` is a relative size estimate (e.g. characters or tokens) used to order
+    the jobs longest-first and to estimate the time remaining. `on_done` is
+    called in the main thread with the result as each job finishes.
+    """
+
+    key: Hashable
+    fn: Callable[[], Any]
+    cost: int = 1
+    label: str = ""
+    on_done: Optional[Callable[[Any], None]] = field(default=None, repr=False)
+
+
+class Progress:
+    """
+    Single line progress and ETA display on stderr. Jobs streaming their
+    output can also report tokens to show their live throughput.
+    """
+
+    def __init__(self, title: str, total_jobs: int, total_cost: int, stream=None):
+        self.title = title
+        self.total_jobs = total_jobs
+        self.total_cost = max(total_cost, 1)
+        self.done_jobs = 0
+        self.done_cost = 0
+        self.started = time.monotonic()
+        self.stream = stream or sys.stderr
+        self.interactive = self.stream.isatty()
+        self.lock = threading.Lock()
+        self.streaming: dict[Hashable, tuple[float, int]] = {}  # started, tokens
+        self.shown = 0.0
+
+    def eta(self) -> Optional[float]:
+        """Seconds remaining, extrapolated from the cost completed so far."""
+        if not self.done_cost:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed / self.done_cost * (self.total_cost - self.done_cost)
+
+    def update(self, job: Job) -> None:
+        with self.lock:
+            self.done_jobs += 1
+            self.done_cost += job.cost
+            self.streaming.pop(job.key, None)
+            self.show(job.label)
+
+    def tokens(self, job: Job, tokens: int) -> None:
+        """The job received this many more streamed tokens."""
+        with self.lock:
+            started, received = self.streaming.get(job.key, (time.monotonic(), 0))
+            self.streaming[job.key] = (started, received + tokens)
+            now = time.monotonic()
+            if self.interactive and now - self.shown > 0.1:
+                rate = (received + tokens) / max(now - started, 1e-3)
+                self.show(f"{job.label} {rate:.0f} tok/s")
+
+    def show(self, label: str = "") -> None:
+        eta = self.eta()
+        line = (
+            f"{self.title}: {self.done_jobs}/{self.total_jobs} "
+            f"({self.done_cost * 100 // self.total_cost}%) "
+            f"ETA {format_seconds(eta) if eta is not None else '--'}"
+        )
+        if label:
+            line += f" {label}"
+        if self.interactive:
+            self.stream.write("\r\033[K" + line)
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+        self.shown = time.monotonic()
+
+    def close(self) -> None:
+        if self.interactive:
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+def format_seconds(seconds: float) -> str:
+    """Format a duration as e.g. '1h02m', '3m12s' or '45s'."""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+
+def report_tokens(tokens: int = 1) -> None:
+    """Report streamed tokens from inside a job, for its live throughput."""
+    progress = getattr(current, "progress", None)
+    if progress:
+        progress.tokens(current.job, tokens)
+
+
+def run_job(job: Job, progress: Optional[Progress]) -> Any:
+    current.job, current.progress = job, progress
+    try:
+        return job.fn()
+    finally:
+        current.job, current.progress = None, None
+
+
+def estimate_duration(durations: list[float], concurrency: int) -> float:
+    """
+    How long jobs of the given durations take to run longest-first on
+    `concurrency` workers, each job going to the first free worker.
+    """
+    workers = [0.0] * max(1, concurrency)
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(workers, workers[0] + duration)
+    return max(workers)
+
+
+def run_jobs(
+    jobs: list[Job], concurrency: int = 4, title: str = "", progress: bool = True
+) -> dict:
+    """
+    Run the jobs on a pool of at most `concurrency` worker threads, longest
+    first, and return a map of job key to result.
+
+    The first job to raise cancels everything still queued and the exception
+    is re-raised once the running jobs have finished.
+    """
+    results = {}
+    if not jobs:
+        return results
+
+    jobs = sorted(jobs, key=lambda j: j.cost, reverse=True)
+    display = (
+        Progress(title, len(jobs), sum(j.cost for j in jobs)) if progress else None
+    )
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {executor.submit(run_job, job, display): job for job in jobs}
+        try:
+            for future in as_completed(futures):
+                job = futures[future]
+                results[job.key] = future.result()
+                if job.on_done:
+                    job.on_done(results[job.key])
+                if display:
+                    display.update(job)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            if display:
+                display.close()
+
+    return results
@@ -1,50 +1,82 @@
 import json
-from collections import defaultdict
+import sqlite3
 from pathlib import Path
 
 
-class Singleton(type):
-    _instances = {}
+class StringMap:
+    """
+    Manage a map of string translations.
 
-    def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+    Stored in `<translations_dir>/strings.db` (SQLite), read one language at a
+    time as it is needed. New translations are written in one transaction by
+    `save`. A `strings.json` from older versions is imported the first time.
+    A `readonly` map (e.g. for rendering) never creates or changes the store.
+    """
 
-
-class StringMap(metaclass=Singleton):
-    """Manage a map of string translations."""
-
-    def __init__(self, config) -> None:
+    def __init__(self, config, readonly: bool = False) -> None:
         self.config = config
+        self.path = config.translations_dir / "strings.db"
+        legacy_file = config.translations_dir / "strings.json"
 
-        # load the strings map file
-
-        self.strings_map_file = config.translations_dir / "strings.json"
-        if self.strings_map_file.exists():
-            self.filenames = json.loads(self.strings_map_file.read_text())
+        new = not self.path.exists()
+        if readonly and new:
+            self.db = sqlite3.connect(":memory:")
+        elif readonly:
+            self.db = sqlite3.connect(
+                f"{self.path.resolve().as_uri()}?mode=ro", uri=True
+            )
         else:
-            self.filenames = defaultdict(dict)  # string: {lang: string}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(self.path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS strings ("
+            "lang TEXT, string TEXT, translation TEXT, PRIMARY KEY (lang, string))"
+        )
+        self.translations: dict[str, dict[str, str]] = {}  # lang: {string: string}
+        self.added: list[tuple[str, str, str]] = []
+
+        if new and legacy_file.exists():
+            for string, langs in json.loads(legacy_file.read_text()).items():
+                for lang, translation in langs.items():
+                    self.added.append((lang, string, translation))
+            self.save()
+
+    def strings(self, lang: str) -> dict[str, str]:
+        """All the strings translated into lang."""
+        if lang not in self.translations:
+            self.translations[lang] = dict(
+                self.db.execute(
+                    "SELECT string, translation FROM strings WHERE lang = ?", (lang,)
+                )
+            )
+        return self.translations[lang]
 
     def add(self, string: str, lang: str, translation: str):
-        if not self.is_translated(string, lang):
-            if not string in self.filenames:
-                self.filenames[string] = {}
-            self.filenames[string][lang] = translation
+        strings = self.strings(lang)
+        if string not in strings:
+            strings[string] = translation
+            self.added.append((lang, string, translation))
 
     def is_translated(self, string: str, lang: str):
-        return string in self.filenames and lang in self.filenames[string]
+        return string in self.strings(lang)
+
+    def missing(self, lang: str, strings: list[str]) -> list[str]:
+        """The unique strings not translated into lang yet, in order."""
+        translated = self.strings(lang)
+        return [s for s in dict.fromkeys(strings) if s not in translated]
 
     def save(self):
-        self.strings_map_file.write_text(
-            json.dumps(self.filenames, indent=4, ensure_ascii=False), "utf8"
-        )
+        """Write the strings added since the last save."""
+        if not self.added:
+            return
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO strings VALUES (?, ?, ?)", self.added
+            )
+        self.added = []
 
     def lookup(self, lang: str, string: str):
-        if string in self.filenames and lang in self.filenames[string]:
-            return self.filenames[string][lang]
-        else:
-            return string
+        return self.strings(lang).get(string, string)
 
     @classmethod
     def to_title(self, file: Path):
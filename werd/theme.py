@@ -0,0 +1,87 @@
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+BYTECODE_CACHE = Path(".werd") / "templates"
+
+
+class ThemeIndex:
+    """
+    The `.j2` templates of a theme, scanned once, so finding the template of
+    a page is a lookup rather than a stat of every candidate file.
+    """
+
+    def __init__(self, theme_dir: Path) -> None:
+        self.theme_dir = Path(theme_dir)
+        self.templates = {
+            file.relative_to(self.theme_dir)
+            for file in self.theme_dir.glob("**/*.j2")
+            if file.is_file()
+        }
+        self.found: dict[tuple[Path, str], Path] = {}  # (parent, stem): template
+
+    @staticmethod
+    def candidates(rel_file: Path) -> list[Path]:
+        """The templates that could render the file, most specific first."""
+
+        def get_stems(stem: str, parent: str) -> list[str]:
+            return [f"{stem}.j2", "index.j2"] + ([f"{parent}.j2"] if parent else [])
+
+        candidates = []
+        for parent in rel_file.parents:
+            candidates += [parent / c for c in get_stems(rel_file.stem, parent.name)]
+        return candidates
+
+    def find(self, rel_file: Path) -> Path:
+        """The template for the file, relative to the theme directory."""
+        key = (rel_file.parent, rel_file.stem)
+        if key not in self.found:
+            try:
+                self.found[key] = next(
+                    c for c in self.candidates(rel_file) if c in self.templates
+                )
+            except StopIteration:
+                raise FileNotFoundError(
+                    f"No template for '{rel_file}' in the theme {self.theme_dir}, "
+                    "add an index.j2 at least."
+                ) from None
+        return self.found[key]
+
+
+def theme_environment(
+    config: dict, assets: Optional[dict[str, str]] = None
+) -> Environment:
+    """
+    The Jinja environment for a build. Templates are compiled once per build
+    (no checking whether they changed) and their bytecode is cached on disk,
+    keyed by a hash of their source, for the next build.
+
+    `assets` maps the asset paths to their (fingerprinted) paths in the
+    output, for the `asset_url()` global, e.g. `{{ asset_url("css/site.css") }}`.
+    """
+    BYTECODE_CACHE.mkdir(parents=True, exist_ok=True)
+    env = Environment(
+        loader=FileSystemLoader(config.theme_dir),
+        bytecode_cache=FileSystemBytecodeCache(BYTECODE_CACHE),
+        auto_reload=False,
+    )
+    assets = dict(assets or {})
+    env.globals["assets"] = assets
+    env.globals["asset_url"] = partial(asset_url, assets)
+    return env
+
+
+def asset_url(assets: dict[str, str], path: str) -> str:
+    """The URL of an asset, with its fingerprint if it has one."""
+    path = path.lstrip("/")
+    return f"/assets/{assets.get(path, path)}"
+
+
+def compile_templates(env: Environment) -> int:
+    """Compile every template of the theme, returns how many."""
+    names = env.list_templates(extensions=["j2"])
+    for name in names:
+        env.get_template(name)
+    return len(names)
@@ -1,14 +1,49 @@
+import hashlib
 import json
 import os
+import pickle
+import time
 from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from itertools import groupby
 from pathlib import Path
 from string import Template
+from typing import Callable, Hashable, Optional
 
 import tiktoken
-from openai import OpenAI
 
+from werd.backends import (
+    Backend,
+    CachingBackend,
+    RateLimitedBackend,
+    StreamingBackend,
+    get_backend,
+)
+from werd.cache import TranslationCache
+from werd.config import BackendConfig
 from werd.content_tracker import ContentTracker
+from werd.files import write_text_atomic
+from werd.journal import Journal
+from werd.rate_limit import RateLimiter
+from werd.scheduler import Job, estimate_duration, format_seconds, run_jobs
 from werd.strings_map import StringMap
+from werd.translation_memory import (
+    TranslationMemory,
+    group_segments,
+    join_segments,
+    segment_hash,
+    split_segments,
+)
+
+MODEL = BackendConfig().model
+JOURNAL = Path(".werd") / "journal.jsonl"
+TRACKER = Path(".werd") / "content.db"
+# Where werd kept the MD5 hash of each translated file before content.db
+LEGACY_TRACKER = Path(".hash")
+CHECKPOINT_SECONDS = 30
+# Bump when the prompts change, to translate everything again
+PROMPT_VERSION = 1
 
 INPUT_TEMPLATE = """lang: ${source_lang}
 ---
@@ -18,16 +53,27 @@ OUTPUT_TEMPLATE = """lang: ${target_lang}
 ---"""
 
 
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """Get the tokenizer for the model, loaded once and reused."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        print("Warning: model not found. Using cl100k_base encoding.")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def num_tokens(text: str, model: str = MODEL) -> int:
+    """Number of tokens in a bit of text."""
+    return len(get_encoding(model).encode(text))
+
+
 def count_tokens(messages, model="gpt-3.5-turbo"):
     """
     Return the number of tokens used by a list of messages.
     From" https://cookbook.openai.com/examples/how_to_count_tokens_with_tiktoken
     """
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        print("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+    encoding = get_encoding(model)
     if model in {
         "gpt-3.5-turbo-0613",
         "gpt-3.5-turbo-16k-0613",
@@ -50,9 +96,9 @@ def count_tokens(messages, model="gpt-3.5-turbo"):
         # print("Warning: gpt-4 may update over time. Returning num tokens assuming gpt-4-0613.")
         return count_tokens(messages, model="gpt-4-0613")
     else:
-        raise NotImplementedError(
-            f"""count_tokens() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
-        )
+        # Not an OpenAI model (e.g. self hosted), so this is only an estimate
+        tokens_per_message = 3
+        tokens_per_name = 1
     num_tokens = 0
     for message in messages:
         num_tokens += tokens_per_message
@@ -79,14 +125,76 @@ def write_content_with_path(
 
     target_dir.mkdir(parents=True, exist_ok=True)
 
-    (targe_dir / file).write_text(content)
+    write_text_atomic(targe_dir / file, content)
 
 
-def translate_string(
-    content: str, source_lang: str, target_lang: str, no_markdown=False
-):
-    """Translate content to lang."""
+def translation_version(model: str) -> str:
+    """What a translation depends on besides the source text."""
+    return f"{model}/{PROMPT_VERSION}"
+
+
+def import_legacy_hashes(
+    config, tracker: ContentTracker, version: str, legacy_path: Path = LEGACY_TRACKER
+) -> None:
+    """
+    Record the files that older versions of werd translated, and which have
+    not changed since, as translated into each output language that has a
+    translation, so upgrading doesn't translate the whole site again.
+    """
+    try:
+        with open(legacy_path, "rb") as f:
+            hashes = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return
 
+    for filepath, checksum in hashes.items():
+        file = Path(filepath)
+        try:
+            content = file.read_text()
+            rel_path = file.relative_to(config.content_dir)
+        except (OSError, ValueError):
+            continue
+        if hashlib.md5(content.encode("utf-8")).hexdigest() != checksum:
+            continue
+        for lang in config.language.output:
+            if (config.translations_dir / lang / rel_path).is_file():
+                tracker.update(file, lang, version)
+
+
+def prune_translation(config, file: Path) -> None:
+    """
+    Delete a translated file, its rendered page and any directories left
+    empty, with their rendered index pages.
+    """
+    rel_path = file.relative_to(config.translations_dir)
+    output = config.output_dir / rel_path
+    file.unlink(missing_ok=True)
+    output.with_suffix(".html").unlink(missing_ok=True)
+    blog_post = output.parent / output.stem / "index.html"  # Blog post page
+    blog_post.unlink(missing_ok=True)
+    remove_empty_dir(blog_post.parent)
+
+    for parent in list(rel_path.parents)[:-2]:  # Not the language root
+        if any((config.translations_dir / parent).iterdir()):
+            break
+        (config.translations_dir / parent).rmdir()
+        (config.output_dir / parent / "index.html").unlink(missing_ok=True)
+        remove_empty_dir(config.output_dir / parent)
+
+
+def remove_empty_dir(path: Path) -> None:
+    if path.is_dir() and not any(path.iterdir()):
+        path.rmdir()
+
+
+def translation_messages(
+    content: str,
+    source_lang: str,
+    target_lang: str,
+    no_markdown=False,
+    context: str = "",
+) -> list[dict]:
+    """The chat messages asking the model to translate content to lang."""
     messages = [
         {
             "role": "system",
@@ -110,84 +218,788 @@ def translate_string(
             "content": Template(OUTPUT_TEMPLATE).substitute(target_lang=target_lang),
         },
     ]
+    if context:
+        messages.insert(
+            1,
+            {
+                "role": "user",
+                "content": "For context only, this is the text that comes just "
+                "before the text to translate. Do not translate it:\n\n" + context,
+            },
+        )
 
-    client = OpenAI()
-    response = client.chat.completions.create(
-        model="gpt-4-32k",
-        messages=messages,
-        max_tokens=count_tokens(messages, model="gpt-4-32k")
-        * 2,  # I guess this ratio depends on the two languages?
+    return messages
+
+
+def translate_string(
+    content: str,
+    source_lang: str,
+    target_lang: str,
+    no_markdown=False,
+    context: str = "",
+    backend: Optional[Backend] = None,
+):
+    """
+    Translate content to lang. The optional context is the text just before
+    the content, to help keep the terminology consistent across chunks.
+    """
+    return request_completion(
+        translation_messages(content, source_lang, target_lang, no_markdown, context),
+        backend,
     )
-    return response.choices[0].message.content
 
 
-def translate_content(config: dict, translate_all: bool = False, langs: list = []):
+def request_completion(
+    messages: list[dict],
+    backend: Optional[Backend] = None,
+    max_tokens: Optional[int] = None,
+):
     """
-    Generate static site from content and theme.
+    Send the chat messages to the backend (OpenAI by default) for a reply of
+    at most max_tokens (defaults to twice the prompt's tokens).
     """
-    print("Translating!")
+    backend = backend or get_backend(BackendConfig())
+    return backend.complete(
+        messages,
+        max_tokens=max_tokens
+        or count_tokens(messages, model=backend.model)
+        * 2,  # I guess this ratio depends on the two languages?
+    )
 
-    tracker = ContentTracker(".hash")
-    strings_map = StringMap(config)
 
-    config.translations_dir.mkdir(parents=True, exist_ok=True)
+def parse_json_reply(reply: str):
+    """Parse a JSON reply, ignoring any markdown code fence around it."""
+    reply = reply.strip()
+    if reply.startswith("```"):
+        reply = reply.split("\n", 1)[-1].rsplit("```", 1)[0]
+    return json.loads(reply)
 
-    # Bits and pieces
 
-    languages = langs if langs else config.language.output
+def multi_translation_messages(
+    content: str, source_lang: str, target_langs: list[str], context: str = ""
+) -> list[dict]:
+    """The chat messages asking the model to translate into several languages."""
+    messages = translation_messages(
+        content, source_lang, ", ".join(target_langs), context=context
+    )
+    messages[0] = {
+        "role": "system",
+        "content": "You are a helpful translation assistant. "
+        "Translate the markdown into each of the target languages preserving the "
+        "markdown formating. Reply with only a JSON object mapping each target "
+        "language code to its translation.",
+    }
+    return messages
 
-    for lang in languages:
-        if lang != config.language.source:
-            for string in ["blog", config.site_name[config.language.source]]:
-                if not strings_map.is_translated(string, lang):
-                    print(f"Translating '{string}' into {lang}...")
-                    translation = translate_string(
-                        string, config.language.source, lang, no_markdown=True
-                    )
-                    print("\r" + translation)
-                    strings_map.add(string, lang, translation)
 
-    # Content files
+def strings_messages(
+    strings: list[str], source_lang: str, target_lang: str
+) -> list[dict]:
+    """The chat messages asking the model to translate a list of strings."""
+    return [
+        {
+            "role": "system",
+            "content": "You are a helpful translation assistant. "
+            "Translate each string in the JSON array into the target language. "
+            "Reply with only a JSON array of [string, translation] pairs "
+            "in the same order as the input.",
+        },
+        {
+            "role": "user",
+            "content": Template(INPUT_TEMPLATE).substitute(
+                content=json.dumps(strings, ensure_ascii=False),
+                source_lang=source_lang,
+            ),
+        },
+        {
+            "role": "user",
+            "content": Template(OUTPUT_TEMPLATE).substitute(target_lang=target_lang),
+        },
+    ]
+
+
+def translate_strings(
+    strings: list[str],
+    source_lang: str,
+    target_lang: str,
+    backend: Optional[Backend] = None,
+):
+    """
+    Translate a list of short strings (titles, names etc.) in one request.
 
-    for file in config.content_dir.glob("**/*"):
+    The model is asked for a JSON array of [source, translation] pairs so we
+    can check the count and order line up. Any string missing or mismatched in
+    the reply is translated on its own with `translate_string`.
+    """
+    messages = strings_messages(strings, source_lang, target_lang)
+
+    try:
+        pairs = parse_json_reply(request_completion(messages, backend))
+        if not isinstance(pairs, list) or len(pairs) != len(strings):
+            pairs = []
+    except ValueError:
+        pairs = []
+
+    translations = []
+    for i, string in enumerate(strings):
+        pair = pairs[i] if i < len(pairs) else None
         if (
-            file.is_file()
-            and file.suffix == ".md"
-            and (translate_all or langs or tracker.has_changed(str(file)))
+            isinstance(pair, list)
+            and len(pair) == 2
+            and isinstance(pair[1], str)
+            and pair[1].strip()
+            and str(pair[0]).strip() == string.strip()
+        ):
+            translations.append(pair[1].strip())
+        else:
+            translations.append(
+                translate_string(
+                    string, source_lang, target_lang, no_markdown=True, backend=backend
+                )
+            )
+
+    return translations
+
+
+class DocumentTranslation:
+    """
+    The segments of a markdown document still missing from the translation
+    memory for one language, grouped into chunks of at most `chunk_tokens`
+    (counted with the model's tokenizer) that can be translated concurrently
+    and stitched back together in order. `on_complete` is called with the
+    translated document once the last chunk is done.
+
+    `shared` maps the segments other documents into the same language are
+    translating to their document and chunk. Those segments are left to
+    them, so each is only translated once in a run, and this document's are
+    added to it.
+    """
+
+    def __init__(
+        self,
+        content: str,
+        source_lang: str,
+        target_lang: str,
+        memory: TranslationMemory,
+        chunk_tokens: int = 2000,
+        context_tokens: int = 200,
+        model: str = MODEL,
+        backend: Optional[Backend] = None,
+        on_complete: Optional[Callable[[str], None]] = None,
+        shared: Optional[dict] = None,
+    ):
+        self.model = backend.model if backend else model
+        self.backend = backend
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.memory = memory
+        self.context_tokens = context_tokens
+        self.on_complete = on_complete
+        self.blocks, self.gaps = split_segments(content)
+        shared = {} if shared is None else shared
+        missing = memory.missing(self.blocks, target_lang)
+        self.chunks = group_segments(
+            [s for s in missing if segment_hash(s) not in shared],
+            chunk_tokens,
+            partial(num_tokens, model=self.model),
+        )
+        self.dependants = defaultdict(list)  # chunk index: documents waiting on it
+        # Chunks still to translate, including those of other documents
+        self.pending = len(self.chunks)
+        for document, i in dict.fromkeys(
+            shared[segment_hash(s)] for s in missing if segment_hash(s) in shared
         ):
+            document.dependants[i].append(self)
+            self.pending += 1
+        for i, chunk in enumerate(self.chunks):
+            for segment in chunk:
+                shared[segment_hash(segment)] = (self, i)
+
+    def context(self, segment: str) -> str:
+        """The last `context_tokens` of source text before the segment."""
+        encoding = get_encoding(self.model)
+        tokens = []
+        for block in reversed(self.blocks[: self.blocks.index(segment)]):
+            if len(tokens) >= self.context_tokens:
+                break
+            tokens = encoding.encode(block + "\n\n") + tokens
+        return encoding.decode(tokens[-self.context_tokens :]) if tokens else ""
+
+    def estimate(self) -> tuple[list[int], list[int]]:
+        """
+        Input and output token estimates for each chunk's request, assuming
+        the translation is about as long as the source.
+        """
+        input_tokens, output_tokens = [], []
+        for chunk in self.chunks:
+            content = "\n\n".join(chunk)
+            context = self.context(chunk[0]) if self.context_tokens else ""
+            messages = translation_messages(
+                content, self.source_lang, self.target_lang, context=context
+            )
+            input_tokens.append(count_tokens(messages, model=self.model))
+            output_tokens.append(num_tokens(content, model=self.model))
+        return input_tokens, output_tokens
+
+    def translate_chunk(self, segments: list[str]) -> list[str]:
+        """
+        Translate the segments in one request. If the translation does not
+        split back into the same number of segments send them one at a time.
+        """
+        context = self.context(segments[0]) if self.context_tokens else ""
+        translation = translate_string(
+            "\n\n".join(segments),
+            self.source_lang,
+            self.target_lang,
+            context=context,
+            backend=self.backend,
+        )
+        translated, _ = split_segments(translation)
+        if len(translated) != len(segments):
+            translated = [
+                translate_string(
+                    segment,
+                    self.source_lang,
+                    self.target_lang,
+                    context=context,
+                    backend=self.backend,
+                ).strip()
+                for segment in segments
+            ]
+        return translated
+
+    def add_chunk(self, segments: list[str], translated: list[str]) -> None:
+        for segment, translation in zip(segments, translated):
+            self.memory.add(segment, self.target_lang, translation)
+        self.chunk_done()
+        for document in self.dependants[self.chunks.index(segments)]:
+            document.chunk_done()
+
+    def chunk_done(self) -> None:
+        self.pending -= 1
+        if not self.pending and self.on_complete:
+            self.on_complete(self.result())
+
+    def jobs(self, key: Hashable, label: str = "") -> list[Job]:
+        return [
+            Job(
+                key=(key, i),
+                fn=partial(self.translate_chunk, chunk),
+                cost=sum(num_tokens(segment, self.model) for segment in chunk),
+                label=label
+                + (f" ({i + 1}/{len(self.chunks)})" if len(self.chunks) > 1 else ""),
+                on_done=partial(self.add_chunk, chunk),
+            )
+            for i, chunk in enumerate(self.chunks)
+        ]
+
+    def result(self) -> str:
+        return join_segments(
+            [self.memory.get(b, self.target_lang) for b in self.blocks], self.gaps
+        )
+
+
+class FanOut:
+    """
+    The same single chunk missing from several `DocumentTranslation`s of one
+    file, translated into all their languages in one request so the source is
+    sent once. Any language missing or mismatched in the reply falls back to
+    its own request.
+    """
+
+    def __init__(self, file: Path, documents: list[DocumentTranslation]):
+        self.file = file
+        self.documents = documents
+        self.chunk = documents[0].chunks[0]
+        self.langs = [document.target_lang for document in documents]
+
+    def messages(self) -> list[dict]:
+        first = self.documents[0]
+        context = first.context(self.chunk[0]) if first.context_tokens else ""
+        return multi_translation_messages(
+            "\n\n".join(self.chunk), first.source_lang, self.langs, context
+        )
+
+    def max_tokens(self, messages: list[dict]) -> int:
+        """The reply budget, twice the prompt for each language."""
+        return (
+            count_tokens(messages, model=self.documents[0].model) * 2 * len(self.langs)
+        )
+
+    def tokens(self) -> int:
+        """The prompt plus the reply budget, to fit in the model's context."""
+        messages = self.messages()
+        return count_tokens(messages, model=self.documents[0].model) + self.max_tokens(
+            messages
+        )
+
+    def translate(self) -> list[list[str]]:
+        """The translated segments for each document."""
+        messages = self.messages()
+        backend = self.documents[0].backend
+        try:
+            reply = parse_json_reply(
+                request_completion(messages, backend, self.max_tokens(messages))
+            )
+        except ValueError:
+            reply = {}
+        if not isinstance(reply, dict):
+            reply = {}
+
+        results = []
+        for document in self.documents:
+            translation = reply.get(document.target_lang)
+            translated = (
+                split_segments(translation)[0] if isinstance(translation, str) else []
+            )
+            if len(translated) != len(self.chunk):
+                translated = document.translate_chunk(self.chunk)
+            results.append(translated)
+        return results
+
+    def add(self, results: list[list[str]]) -> None:
+        for document, translated in zip(self.documents, results):
+            document.add_chunk(self.chunk, translated)
+
+    def job(self) -> Job:
+        model = self.documents[0].model
+        return Job(
+            key=(str(self.file), tuple(self.langs)),
+            fn=self.translate,
+            cost=sum(num_tokens(segment, model) for segment in self.chunk),
+            label=f"{self.file} [{','.join(self.langs)}]",
+            on_done=self.add,
+        )
+
+    def estimate(self) -> "Estimate":
+        model = self.documents[0].model
+        return Estimate(
+            str(self.file),
+            ",".join(self.langs),
+            [count_tokens(self.messages(), model=model)],
+            [num_tokens("\n\n".join(self.chunk), model) * len(self.langs)],
+        )
+
+
+def translate_document(
+    content: str,
+    source_lang: str,
+    target_lang: str,
+    memory: TranslationMemory,
+    chunk_tokens: int = 2000,
+    concurrency: int = 1,
+    backend: Optional[Backend] = None,
+):
+    """
+    Translate a markdown document reusing the translation memory for every
+    segment it already knows, so only new or edited segments are sent to the
+    model, in chunks of at most `chunk_tokens`.
+    """
+    document = DocumentTranslation(
+        content, source_lang, target_lang, memory, chunk_tokens, backend=backend
+    )
+    run_jobs(document.jobs("document"), concurrency, progress=False)
+    return document.result()
+
+
+@dataclass
+class Estimate:
+    """Token estimates for the requests of one job in a `TranslationPlan`."""
+
+    name: str
+    lang: str
+    input_tokens: list[int]  # per request
+    output_tokens: list[int]
+
+    def cost(self, translate_config) -> float:
+        return (
+            sum(self.input_tokens) * translate_config.input_cost
+            + sum(self.output_tokens) * translate_config.output_cost
+        ) / 1000
+
+
+class TranslationPlan:
+    """
+    Works out which strings and which (file, language) pairs need translating
+    and what is still missing from the translation memory, without calling the
+    model or changing anything. It can then be estimated or run, unless it is
+    `readonly`, which doesn't create or change the tracker and strings stores.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        translate_all: bool = False,
+        langs: list = [],
+        resume: bool = False,
+        readonly: bool = False,
+    ):
+        self.config = config
+        self.source_lang = config.language.source
+        self.tracker = ContentTracker(TRACKER, readonly)
+        self.strings_map = StringMap(config, readonly)
+        self.version = translation_version(config.backend.model)
+        if self.tracker.created:
+            import_legacy_hashes(config, self.tracker, self.version)
+            self.tracker.save()
+        self.memory = TranslationMemory(
+            config.translations_dir / "memory.json", self.version
+        )
+        self.journal = Journal(JOURNAL)
+        self.resume = resume
+        # What a run that died before saving the tracker had finished
+        for file, lang, version, checksum in self.journal.finished():
+            self.tracker.update(file, lang, version, checksum)
+
+        if resume:
+            # Just what the interrupted run had left to do
+            self.jobs = [
+                (Path(file), lang)
+                for file, lang in self.journal.pending()
+                if Path(file).is_file()
+            ]
+            self.languages = list(dict.fromkeys(lang for _, lang in self.jobs))
+        else:
+            self.languages = langs if langs else config.language.output
+            self.jobs = [
+                (file, lang)
+                for file in sorted(config.content_dir.glob("**/*"))
+                if file.is_file() and file.suffix == ".md"
+                for lang in self.languages
+                if translate_all
+                or langs
+                or self.tracker.has_changed(file, lang, self.version)
+            ]
+        self.files = list(dict.fromkeys(file for file, _ in self.jobs))
+        # What the files were translated from, in case they change meanwhile
+        self.checksums = {file: self.tracker.checksum(file) for file in self.files}
+        self.orphans = self.plan_orphans()
+        self.titles = [StringMap.to_title(file) for file in self.files]
+        self.strings = self.plan_strings()
+        self.documents = self.plan_documents()
+        self.fan_outs = self.plan_fan_outs()
+
+    def plan_orphans(self) -> list[Path]:
+        """
+        Translations of source files that have been deleted or renamed. None
+        if there are no source files at all, as then the content_dir (or the
+        working directory) is more likely to be wrong.
+        """
+        if not any(self.config.content_dir.glob("**/*.md")):
+            print(
+                f"No markdown files in {self.config.content_dir}, "
+                "not removing any translations."
+            )
+            return []
+        orphans = []
+        for lang in self.config.language.output:
+            root = self.config.translations_dir / lang
+            for file in sorted(root.glob("**/*.md")):
+                if not (self.config.content_dir / file.relative_to(root)).exists():
+                    orphans.append(file)
+        return orphans
+
+    def plan_strings(self) -> list[tuple[str, list[str]]]:
+        """Batches of (lang, strings) still to translate."""
+        strings = ["blog", self.config.site_name[self.source_lang]] + self.titles
+        batch_size = self.config.translate.strings_batch_size
+        batches = []
+        for lang in self.languages:
+            if lang != self.source_lang:
+                pending = self.strings_map.missing(lang, strings)
+                for i in range(0, len(pending), batch_size):
+                    batches.append((lang, pending[i : i + batch_size]))
+        return batches
+
+    def plan_documents(self) -> list[tuple[Path, str, DocumentTranslation]]:
+        documents = []
+        shared = defaultdict(dict)  # lang: segments being translated, see below
+        for file, jobs in groupby(self.jobs, key=lambda job: job[0]):
             content = file.read_text()
-            tracker.update(file)
+            for _, lang in jobs:
+                if lang != self.source_lang:
+                    document = DocumentTranslation(
+                        content,
+                        self.source_lang,
+                        lang,
+                        self.memory,
+                        self.config.translate.chunk_tokens,
+                        self.config.translate.chunk_context_tokens,
+                        model=self.config.backend.model,
+                        shared=shared[lang],
+                    )
+                    documents.append((file, lang, document))
+        return documents
 
-            for lang in languages:
-                # Translate the filename
+    def plan_fan_outs(self) -> list[FanOut]:
+        """
+        With `translate.fan_out` on, group the languages of a file missing the
+        same short text into requests for several languages at once, each
+        expected to reply with at most `translate.fan_out_max_tokens` and
+        with the prompt and reply budget within `backend.context_window`.
+        """
+        if not self.config.translate.fan_out:
+            return []
 
-                string = StringMap.to_title(file)
-                if config.language.source != lang:
-                    if not strings_map.is_translated(string, lang):
-                        print(f"Translating '{string}' into {lang}")
-                        translation = translate_string(
-                            string, config.language.source, lang
+        fan_outs = []
+        for file, documents in groupby(self.documents, key=lambda d: d[0]):
+            same_chunk = defaultdict(list)
+            for _, _, document in documents:
+                if len(document.chunks) == 1:
+                    same_chunk[tuple(document.chunks[0])].append(document)
+
+            for chunk, documents in same_chunk.items():
+                tokens = sum(num_tokens(s, self.config.backend.model) for s in chunk)
+                per_request = self.config.translate.fan_out_max_tokens // max(tokens, 1)
+                groups = [[]]
+                for document in documents:
+                    group = groups[-1] + [document]
+                    if len(group) > 1 and (
+                        len(group) > per_request
+                        or FanOut(file, group).tokens()
+                        > self.config.backend.context_window
+                    ):
+                        groups.append([document])
+                    else:
+                        groups[-1] = group
+                fan_outs += [FanOut(file, g) for g in groups if len(g) > 1]
+
+        return fan_outs
+
+    def fanned_out(self) -> set[int]:
+        """ids of the documents translated by the fan outs."""
+        return {id(d) for fan_out in self.fan_outs for d in fan_out.documents}
+
+    def estimates(self) -> list[Estimate]:
+        """Token estimates for every job that needs the model."""
+        estimates = []
+        for lang, batch in self.strings:
+            messages = strings_messages(batch, self.source_lang, lang)
+            estimates.append(
+                Estimate(
+                    f"{len(batch)} strings",
+                    lang,
+                    [count_tokens(messages, model=self.config.backend.model)],
+                    # The reply repeats each string next to its translation
+                    [
+                        2
+                        * num_tokens(
+                            json.dumps(batch, ensure_ascii=False),
+                            self.config.backend.model,
                         )
-                        strings_map.add(string, lang, translation)
-                else:
-                    strings_map.add(string, lang, string)
+                    ],
+                )
+            )
+        fanned_out = self.fanned_out()
+        for file, lang, document in self.documents:
+            if document.chunks and id(document) not in fanned_out:
+                estimates.append(Estimate(str(file), lang, *document.estimate()))
+        estimates += [fan_out.estimate() for fan_out in self.fan_outs]
+        return estimates
 
-                # Translate the content
+    def add_strings(self, lang: str, strings: list[str], translations: list[str]):
+        for string, translation in zip(strings, translations):
+            self.strings_map.add(string, lang, translation)
+        self.strings_map.save()
 
-                lang_dir = config.translations_dir / lang
+    def concurrency(self, concurrency: Optional[int] = None) -> int:
+        """The given concurrency or else the backend's or else the default."""
+        return (
+            concurrency
+            or self.config.backend.concurrency
+            or self.config.translate.concurrency
+        )
 
-                if lang != config.language.source:
-                    print(f"Translating file {file} into {lang}...")
-                    translated_content = translate_string(
-                        content, config.language.source, lang
-                    )
-                    write_content_with_path(
-                        file, lang_dir, translated_content, config.content_dir
-                    )
+    def run(self, concurrency: Optional[int] = None) -> None:
+        """
+        Every batch of strings for a language and every chunk of a file that
+        needs translating is a job run concurrently by `run_jobs`, at most
+        `concurrency` at a time (see `TranslationPlan.concurrency`).
+        """
+        config = self.config
+        config.translations_dir.mkdir(parents=True, exist_ok=True)
+        concurrency = self.concurrency(concurrency)
+        backend = get_backend(config.backend)
+        if config.translate.stream:
+            backend = StreamingBackend(config.backend, backend)
+        backend = RateLimitedBackend(
+            config.backend,
+            backend,
+            RateLimiter(
+                config.backend.requests_per_minute,
+                config.backend.tokens_per_minute,
+                max_concurrency=concurrency,
+            ),
+            partial(count_tokens, model=config.backend.model),
+        )
+        self.saved = time.monotonic()
+        cache = None
+        # Record and replay every request, not just those the cache misses
+        recording = config.backend.record or config.backend.provider == "replay"
+        if config.cache.enabled and not recording:
+            cache = TranslationCache.from_config(config.cache)
+            backend = CachingBackend(config.backend, backend, cache)
+
+        jobs = []
+
+        # Bits and pieces
+
+        for i, (lang, batch) in enumerate(self.strings):
+            jobs.append(
+                Job(
+                    key=("strings", lang, i),
+                    fn=partial(
+                        translate_strings, batch, self.source_lang, lang, backend
+                    ),
+                    cost=num_tokens(
+                        json.dumps(batch, ensure_ascii=False), backend.model
+                    ),
+                    label=f"{len(batch)} strings [{lang}]",
+                    on_done=partial(self.add_strings, lang, batch),
+                )
+            )
+
+        if self.source_lang in self.languages:
+            for title in self.titles:
+                self.strings_map.add(title, self.source_lang, title)
+
+        # Content files
+
+        self.prune()
+
+        if not self.resume:
+            self.journal.start([(str(file), lang) for file, lang in self.jobs])
+
+        def done(file: Path, lang: str) -> None:
+            """Record a finished (file, lang) so it is skipped from now on."""
+            self.journal.done(str(file), lang, self.version, self.checksums[file])
+            self.tracker.update(file, lang, self.version, self.checksums[file])
+
+        for file, lang in self.jobs:
+            if lang == self.source_lang:
+                # Just copy the file
+                print(f"Copying {file}...")
+                write_content_with_path(
+                    file,
+                    config.translations_dir / self.source_lang,
+                    file.read_text(),
+                    config.content_dir,
+                )
+                done(file, lang)
+
+        def write(file: Path, lang: str, content: str) -> None:
+            write_content_with_path(
+                file, config.translations_dir / lang, content, config.content_dir
+            )
+            done(file, lang)
+            self.checkpoint()
+
+        fanned_out = self.fanned_out()
+        for file, lang, document in self.documents:
+            if document.pending:
+                document.backend = backend
+                document.on_complete = partial(write, file, lang)
+                if id(document) not in fanned_out:
+                    jobs += document.jobs((str(file), lang), f"{file} [{lang}]")
+            else:
+                write(file, lang, document.result())
+
+        jobs += [fan_out.job() for fan_out in self.fan_outs]
+
+        try:
+            run_jobs(jobs, concurrency, title="Translating")
+        finally:
+            self.tracker.save()
+            self.strings_map.save()
+            self.checkpoint(force=True)
+            if cache:
+                cache.prune()
+        self.journal.finish()
+
+    def prune(self) -> None:
+        """
+        Remove the translations and rendered pages of deleted or renamed source
+        files and stop tracking them.
+        """
+        for file in self.orphans:
+            print(f"Removing {file}...")
+            prune_translation(self.config, file)
+        for path in self.tracker.paths():
+            if not Path(path).exists():
+                self.tracker.forget(path)
+
+    def checkpoint(self, force: bool = False) -> None:
+        """
+        Save the translation memory, at most every `CHECKPOINT_SECONDS` unless
+        forced, as rewriting it after every file would be quadratic.
+        """
+        now = time.monotonic()
+        if force or now - self.saved > CHECKPOINT_SECONDS:
+            self.memory.save()
+            self.saved = now
+
+
+def print_plan(plan: TranslationPlan, concurrency: Optional[int] = None) -> None:
+    """Print the jobs in the plan with their token, cost and time estimates."""
+    translate_config = plan.config.translate
+    concurrency = plan.concurrency(concurrency)
+    estimates = plan.estimates()
+
+    print(f"{'lang':<6}{'requests':>9}{'input':>10}{'output':>10}  job")
+    for estimate in estimates:
+        print(
+            f"{estimate.lang:<6}{len(estimate.input_tokens):>9}"
+            f"{sum(estimate.input_tokens):>10}{sum(estimate.output_tokens):>10}"
+            f"  {estimate.name}"
+        )
+
+    requests = [
+        (input_tokens, output_tokens)
+        for estimate in estimates
+        for input_tokens, output_tokens in zip(
+            estimate.input_tokens, estimate.output_tokens
+        )
+    ]
+    duration = estimate_duration(
+        [
+            translate_config.request_latency
+            + output_tokens / translate_config.output_tokens_per_second
+            for _, output_tokens in requests
+        ],
+        concurrency,
+    )
+    print(
+        f"\n{len(estimates)} jobs, {len(requests)} requests, "
+        f"{sum(i for i, _ in requests)} input tokens, "
+        f"{sum(o for _, o in requests)} output tokens"
+    )
+    print(
+        f"Estimated cost ${sum(e.cost(translate_config) for e in estimates):.2f}, "
+        f"time {format_seconds(duration)} with {concurrency} concurrent requests"
+    )
+    if plan.orphans:
+        print(f"\nWould remove {len(plan.orphans)} translations of deleted files:")
+        for file in plan.orphans:
+            print(f"  {file}")
+
+
+def translate_content(
+    config: dict,
+    translate_all: bool = False,
+    langs: list = [],
+    concurrency: Optional[int] = None,
+    resume: bool = False,
+):
+    """
+    Generate static site from content and theme.
+    """
+    print("Translating!")
 
-                else:
-                    # Just copy the file
-                    print(f"Copying {file}...")
-                    write_content_with_path(file, lang_dir, content, config.content_dir)
+    journal = Journal(JOURNAL)
+    if resume and not journal.exists():
+        print("No interrupted run to resume.")
+        return
+    if not resume and journal.exists():
+        print("Starting over an interrupted run, use --resume to continue it.")
 
-    strings_map.save()
+    TranslationPlan(config, translate_all, langs, resume).run(concurrency)
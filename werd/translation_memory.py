@@ -0,0 +1,158 @@
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from werd.files import write_text_atomic
+
+FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})")
+HEADING_RE = re.compile(r"^\s{0,3}#{1,6}(\s|$)")
+LIST_RE = re.compile(r"^\s*([-*+]|\d+[.)])\s")
+TABLE_RE = re.compile(r"^\s*\|")
+
+
+def starts_block(line: str) -> bool:
+    """Does the line start a new block, even without a blank line before it?"""
+    return bool(
+        FENCE_RE.match(line)
+        or HEADING_RE.match(line)
+        or LIST_RE.match(line)
+        or TABLE_RE.match(line)
+    )
+
+
+def block_ranges(lines: list[str]) -> list[tuple[int, int]]:
+    """Find the [start, end) line ranges of each block of markdown."""
+    ranges = []
+    i, n = 0, len(lines)
+    while i < n:
+        line = lines[i]
+        if not line.strip():
+            i += 1
+            continue
+
+        start = i
+        fence = FENCE_RE.match(line)
+        if fence:
+            # Everything up to and including the closing fence
+            i += 1
+            while i < n and not lines[i].lstrip().startswith(fence.group(1)):
+                i += 1
+            i = min(i + 1, n)
+        elif HEADING_RE.match(line):
+            i += 1
+        elif TABLE_RE.match(line):
+            while i < n and TABLE_RE.match(lines[i]):
+                i += 1
+        else:
+            # Paragraph or list item plus its continuation lines
+            i += 1
+            while i < n and lines[i].strip() and not starts_block(lines[i]):
+                i += 1
+
+        ranges.append((start, i))
+
+    return ranges
+
+
+def split_segments(text: str) -> tuple[list[str], list[str]]:
+    """
+    Split markdown into block level segments (paragraphs, headings, list items,
+    tables and code blocks) and the whitespace gaps around them so that:
+
+        text == gaps[0] + blocks[0] + gaps[1] + ... + blocks[-1] + gaps[-1]
+    """
+    lines = text.split("\n")
+    ranges = block_ranges(lines)
+    if not ranges:
+        return [], [text]
+
+    blocks = ["\n".join(lines[start:end]) for start, end in ranges]
+    gaps = ["".join(line + "\n" for line in lines[: ranges[0][0]])]
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        gaps.append("\n" + "".join(line + "\n" for line in lines[end:start]))
+    gaps.append("".join("\n" + line for line in lines[ranges[-1][1] :]))
+
+    return blocks, gaps
+
+
+def join_segments(blocks: list[str], gaps: list[str]) -> str:
+    """Inverse of `split_segments`."""
+    return gaps[0] + "".join(b + g for b, g in zip(blocks, gaps[1:]))
+
+
+def group_segments(
+    segments: list[str], max_size: int, size: Callable[[str], int]
+) -> list[list[str]]:
+    """
+    Pack consecutive segments into groups no bigger than max_size, measured
+    with `size`. A segment bigger than max_size on its own gets its own group.
+    """
+    groups: list[list[str]] = []
+    group_size = 0
+    for segment in segments:
+        segment_size = size(segment)
+        if not groups or group_size + segment_size > max_size:
+            groups.append([])
+            group_size = 0
+        groups[-1].append(segment)
+        group_size += segment_size
+
+    return groups
+
+
+def segment_hash(segment: str) -> str:
+    return hashlib.sha1(segment.strip().encode("utf-8")).hexdigest()
+
+
+class TranslationMemory:
+    """
+    Translations of markdown segments keyed by a hash of the source segment,
+    per target language. Safe to share between translation worker threads.
+
+    With a `version` (e.g. of the model and prompts) only the translations
+    made with that version are kept. Those from before translations were
+    versioned are taken as that version's, so they aren't paid for again.
+    """
+
+    def __init__(self, path: Path, version: str = "") -> None:
+        self.path = Path(path)
+        self.version = version
+        self.lock = threading.Lock()
+        self.segments = {}  # lang[@version]: {hash: translation}
+        if self.path.exists():
+            segments = json.loads(self.path.read_text())
+            self.segments = self.migrate(segments) if version else segments
+
+    def migrate(self, segments: dict) -> dict:
+        """Just this version's translations, including the unversioned ones."""
+        migrated = {}
+        for key in sorted(segments, key=lambda key: "@" in key):  # Unversioned first
+            lang, _, version = key.partition("@")
+            if not version or version == self.version:
+                migrated.setdefault(self.key(lang), {}).update(segments[key])
+        return migrated
+
+    def key(self, lang: str) -> str:
+        return f"{lang}@{self.version}" if self.version else lang
+
+    def get(self, segment: str, lang: str) -> Optional[str]:
+        return self.segments.get(self.key(lang), {}).get(segment_hash(segment))
+
+    def add(self, segment: str, lang: str, translation: str) -> None:
+        with self.lock:
+            self.segments.setdefault(self.key(lang), {})[
+                segment_hash(segment)
+            ] = translation
+
+    def missing(self, blocks: list[str], lang: str) -> list[str]:
+        """The unique blocks not translated into lang yet, in document order."""
+        return [b for b in dict.fromkeys(blocks) if self.get(b, lang) is None]
+
+    def save(self) -> None:
+        with self.lock:
+            write_text_atomic(
+                self.path, json.dumps(self.segments, indent=4, ensure_ascii=False)
+            )